@@ -13,6 +13,14 @@ a = Analysis(
     hiddenimports=[
         'database.main_database',
         'database.default_database_details',
+        'database.engine_registry',
+        'database.connection_profiles',
+        'database.session_tracking',
+        'database.write_tracking',
+        'database.reference_catalog',
+        'database.query_cache',
+        'database.async_database',
+        'database.migrations',
         'constants',
         'ui_logic.new_setup',
         'ui_logic.login',
@@ -22,6 +30,12 @@ a = Analysis(
         'ui_logic.question_processing',
         'ui_logic.survey_processing',
         'ui_logic.scores',
+        'ui_logic.background_executor',
+        'scoring.engine',
+        'scoring.score_cache',
+        'scoring.ratings',
+        'scoring.simulator',
+        'scoring.bootstrap',
         'sqlalchemy.sql.default_comparator'
     ],
     hookspath=[],
@@ -25,23 +25,11 @@ def createUsers():
 def createSurveys(number: int):
     manager = DatabaseManager()
     begin_date = "1/1/2008"
-    #create the appropriate number of surveys
+    #create the appropriate number of surveys and invite all users to each one
     for i in range (0, number):
         date = random_date(begin_date, "1/1/2024", random.random())
-        manager.createSurvey(date)
+        manager.createSurveyWithInvitations(date=date)
         begin_date = date.strftime("%d/%m/%Y")
-    inviteUsers()
-
-def inviteUsers():
-    manager = DatabaseManager()
-    users = manager.getUser()
-    surveys = manager.getSurvey()
-
-    for user in users:
-        for survey in surveys:
-            if(user.roleID == "UNIVERSAL"):
-                continue
-            manager.inviteUserToSurvey(user.userID, survey.surveyID)
 
 def addResponses():
     manager = DatabaseManager()
@@ -51,19 +39,17 @@ def addResponses():
     for user in users:
         for survey in manager.getSurveysToCompleteForUser(user.userID):
             available_questions = manager.getQuestionsForRole(user.roleID)
-            #go through all available questions
+            #generate responses for all available questions and submit them together
+            answers = {}
             for question in available_questions:
-                chosen_responses = generateResponses(question)
-                #add all responses
-                for response in chosen_responses:
-                    manager.addResponse(question.questionID, user.userID, response, survey.surveyID)
-            manager.setUserFinishedSurvey(survey.surveyID, user.userID)
+                answers[question.questionID] = generateResponses(question)
+            manager.submitSurvey(user.userID, survey.surveyID, answers)
 
 #generate a list of responses
 def generateResponses(question):
 
     chosen_responses = []
-    available_responses = question.answer.answer.split(';')
+    available_responses = [option.text for option in question.options]
 
     #add only one response if response type is single
     if(question.answer.type == "single"):
@@ -110,7 +96,7 @@ def random_date(start, end, prop):
 
 #unneccessary additions are commented out as needed
 
+DatabaseManager().migrateDatabase()
 createUsers()
 createSurveys(3)
-inviteUsers()
 addResponses()
\ No newline at end of file
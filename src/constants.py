@@ -7,8 +7,16 @@ class ConstantsAndUtilities:
         
         self._config_file = 'config.json'
         self._database_path_entry = 'database_path'
+        self._connection_profile_entry = 'connection_profile'
+        self._session_leak_detection_entry = 'session_leak_detection'
+        self._query_cache_entry = 'query_cache'
+        self._scoring_mode_entry = 'scoring_mode'
+        self._contention_log_entry = 'contention_log'
+        #used when config.json doesn't choose a connection profile, see database/connection_profiles.py
+        self.default_connection_profile = 'shared'
         self._database_path = self.loadDatabasePath()
         self.database_name = "SATDatabase.db"
+        self.contention_log_name = "contention.log"
         script_dir = os.path.dirname(os.path.abspath(__file__))
         self.main_icon_location = os.path.join(script_dir, 'resources/logos', 'favicon.png')
         self.keyring_service_name = "SAT"
@@ -16,22 +24,49 @@ class ConstantsAndUtilities:
 
 
     def loadDatabasePath(self):
+        config = self.readConfig()
+
+        #only write when the entry is missing, this is called from background loads too
+        #and a rewrite racing another thread's read would lose the stored path
+        if(self._database_path_entry not in config):
+            config[self._database_path_entry] = ''
+            with open(self._config_file, 'w') as file:
+                json.dump(config, file, indent=2)
+
+        return config[self._database_path_entry]
+
+    def getDatabasePath(self):
+        return self.loadDatabasePath()
+
+    #contents of config.json, empty if the file is missing or unreadable
+    def readConfig(self):
         try:
             with open(self._config_file, 'r') as file:
-                config = json.load(file)
+                return json.load(file)
         except:
-            config = {}
+            return {}
 
-        config.setdefault(self._database_path_entry, '')
+    #the connection profile is either a profile name ("shared", "local")
+    #or an object with an optional "profile" base and the settings to override
+    def getConnectionProfile(self):
+        return self.readConfig().get(self._connection_profile_entry, self.default_connection_profile)
 
-        with open(self._config_file, 'w') as file:
-            json.dump(config, file, indent=2)
+    #false (default), true, or an object with max_entries and/or max_age (seconds)
+    def getQueryCacheSettings(self):
+        return self.readConfig().get(self._query_cache_entry, False)
 
-        return config[self._database_path_entry]
+    #"standard" (default) or "weighted", see scoring/engine.py
+    def isWeightedScoring(self):
+        return self.readConfig().get(self._scoring_mode_entry, "standard") == "weighted"
 
-    def getDatabasePath(self):
-        return self.loadDatabasePath()
+    #debug option, reports database sessions that are left open
+    def getSessionLeakDetection(self):
+        return self.readConfig().get(self._session_leak_detection_entry, False) == True
     
+    #operator option, appends each run's write lock contention to contention.log next to the database
+    def getContentionLog(self):
+        return self.readConfig().get(self._contention_log_entry, False) == True
+
     def setDatabasePath(self, new_path):
 
         if(self.validatePath(new_path) == False):
@@ -0,0 +1,376 @@
+from sqlalchemy import event, select, update, insert, literal
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload, selectinload
+from datetime import datetime
+import asyncio
+import threading
+import time
+import json
+import bcrypt
+import keyring
+
+from database.main_database import (Role, User, Survey, UserProgress, Response, Question, Category, Answer,
+                                    QuestionRoleAssociation, AnswerOption, RatingFormula, SurveyAnswer,
+                                    DataVersion, ScoreCacheEntry, writeSurveyAnswers, categoryTotalsQuery,
+                                    scoresFromTotals, responseMatrix, dataStamps, scoreCacheUpsert)
+from database.connection_profiles import ConnectionProfile, ContentionStats, isLockError
+from database.session_tracking import TrackedSession
+from database.write_tracking import TableWriteTracker
+from database.reference_catalog import ReferenceCatalog
+from constants import ConstantsAndUtilities
+
+#asyncio counterpart of DatabaseManager with the same query surface (all methods are coroutines)
+#built on SQLAlchemy's asyncio extension and the aiosqlite driver, every call uses its own
+#session and pooled connection so independent queries can be awaited concurrently (asyncio.gather)
+#the desktop UI can drive it from a qasync-style event loop
+#the schema is not created here, run DatabaseManager().migrateDatabase() first
+#setup, roles, passwords and session tokens and the diagnostics stay on DatabaseManager only
+class AsyncDatabaseManager:
+
+    _engines = {}
+    _session_factories = {}
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.constants = ConstantsAndUtilities()
+        database_file = self.constants.getDatabasePath() + "/" + self.constants.database_name
+        #same key as DatabaseManager so both share the reference catalog and see each other's writes
+        self.db_url = "sqlite:///" + database_file
+        self.async_url = "sqlite+aiosqlite:///" + database_file
+        self.profile = ConnectionProfile.fromConfig(self.constants.getConnectionProfile())
+        self.engine, self.Session = self._getEngine()
+
+    #one async engine and session factory per database, like EngineRegistry for DatabaseManager
+    def _getEngine(self):
+        with self._lock:
+            if(self.async_url not in self._engines):
+                engine = create_async_engine(self.async_url, echo=False,
+                                             connect_args={"timeout": self.profile.busy_timeout / 1000})
+                event.listen(engine.sync_engine, "connect", self.profile.applyPragmas)
+
+                #a session class per database so commits are announced under the right url
+                session_class = type("AsyncTrackedSession", (TrackedSession,), {})
+                TableWriteTracker.install(session_class, self.db_url)
+
+                self._engines[self.async_url] = engine
+                self._session_factories[self.async_url] = async_sessionmaker(engine, sync_session_class=session_class,
+                                                                             expire_on_commit=False)
+            return self._engines[self.async_url], self._session_factories[self.async_url]
+
+    #close the pooled connections, must be awaited on the loop that used them
+    @classmethod
+    async def dispose(cls):
+        with cls._lock:
+            engines = list(cls._engines.values())
+            cls._engines.clear()
+            cls._session_factories.clear()
+        for engine in engines:
+            await engine.dispose()
+
+    def get_session(self):
+        return self.Session()
+
+    #async version of DatabaseManager.runTransaction, work is a coroutine function taking the session
+    async def runTransaction(self, work):
+        lock_wait = 0.0
+        for attempt in range(self.profile.max_retries + 1):
+            async with self.get_session() as session:
+                try:
+                    #see DatabaseManager.runTransaction, only the wait for the write lock is measured
+                    waiting = time.monotonic()
+                    try:
+                        await (await session.connection()).exec_driver_sql("BEGIN IMMEDIATE")
+                    finally:
+                        lock_wait += time.monotonic() - waiting
+                    result = await work(session)
+                    await session.commit()
+                    ContentionStats.record(attempt, lock_wait)
+                    return result
+                except OperationalError as error:
+                    await session.rollback()
+                    if(not isLockError(error)):
+                        raise
+                    if(attempt == self.profile.max_retries):
+                        ContentionStats.record(attempt, lock_wait, failed=True)
+                        raise
+                except:
+                    await session.rollback()
+                    raise
+            await asyncio.sleep(self.profile.retry_backoff * (2 ** attempt))
+
+    #reference data, shared with DatabaseManager.getCatalog
+    async def getCatalog(self):
+        catalog = ReferenceCatalog.get(self.db_url)
+        if(catalog is not None):
+            return catalog
+
+        generation = ReferenceCatalog.generation(self.db_url)
+        async with self.get_session() as session:
+            #see DatabaseManager.getCatalog
+            scoring_version = (await session.scalars(
+                select(DataVersion.version).filter(DataVersion.scope == "scoring"))).first()
+            questions = (await session.scalars(
+                select(Question).options(joinedload(Question.answer), joinedload(Question.category),
+                                         selectinload(Question.options)))).unique().all()
+            catalog = ReferenceCatalog(
+                roles=(await session.scalars(select(Role))).all(),
+                categories=(await session.scalars(select(Category))).all(),
+                answers=(await session.scalars(select(Answer).order_by(Answer.answerID))).all(),
+                questions=questions,
+                associations=(await session.scalars(select(QuestionRoleAssociation))).all(),
+                options=(await session.scalars(select(AnswerOption))).all(),
+                rating_formulas=(await session.scalars(select(RatingFormula))).all(),
+                scoring_version=scoring_version or 0
+            )
+        ReferenceCatalog.store(self.db_url, catalog, generation)
+        return catalog
+
+    async def getRole(self, roleID=None):
+        if(roleID == None):
+            return (await self.getCatalog()).getRoles()
+        return (await self.getCatalog()).getRole(roleID)
+
+    async def getCategories(self):
+        return (await self.getCatalog()).getCategories()
+
+    async def getCategory(self, categoryID):
+        return (await self.getCatalog()).getCategory(categoryID)
+
+    async def getQuestionsForRole(self, roleID):
+        return (await self.getCatalog()).getQuestionsForRole(roleID)
+
+    async def getQuestionsByCategory(self, categoryID = None, category_name = None):
+        catalog = await self.getCatalog()
+        if(categoryID is not None):
+            return catalog.getQuestionsByCategory(categoryID)
+        elif(category_name is not None):
+            category = catalog.getCategory(name=category_name)
+            if(category is None):
+                return []
+            return catalog.getQuestionsByCategory(category.categoryID)
+
+    async def getQuestions(self):
+        return (await self.getCatalog()).getQuestions()
+
+    async def getQuestion(self, qID = None, qText = None):
+        if(qID is not None):
+            return (await self.getCatalog()).getQuestion(questionID=qID)
+        elif(qText is not None):
+            return (await self.getCatalog()).getQuestion(text=qText)
+
+    async def getQuestionsForRoleByCategory(self, roleID, categoryID):
+        return (await self.getCatalog()).getQuestionsForRoleByCategory(roleID, categoryID)
+
+    async def getAnswer(self, answerID):
+        return (await self.getCatalog()).getAnswer(answerID)
+
+    async def getAnswers(self):
+        return (await self.getCatalog()).getAnswers()
+
+    async def getAnswerOptions(self, questionID):
+        return (await self.getCatalog()).getAnswerOptions(questionID)
+
+    async def getAnswerOption(self, questionID, text=None, ordinal=None):
+        return (await self.getCatalog()).getAnswerOption(questionID, text=text, ordinal=ordinal)
+
+    async def getRatingFormulas(self):
+        return (await self.getCatalog()).getRatingFormulas()
+
+    #users and surveys
+
+    async def getUser(self, userID=None, token="no_token"):
+        if(token is None):
+            return None
+        async with self.get_session() as session:
+            if(token != "no_token"):
+                return (await session.scalars(select(User).filter_by(token=token))).first()
+            if(userID == None):
+                return (await session.scalars(select(User))).all()
+            return (await session.scalars(select(User).filter_by(userID=userID))).first()
+
+    async def getCurrentUser(self):
+        token = keyring.get_password(self.constants.keyring_service_name, self.constants.keyring_user_name)
+        return await self.getUser(token=token)
+
+    async def checkUsernameUnique(self, username):
+        return await self.getUser(userID=username) is None
+
+    async def getUsersByTechnicality(self, is_technical):
+        async with self.get_session() as session:
+            return (await session.scalars(select(User).filter_by(is_technical=is_technical))).all()
+
+    async def getSurvey(self, surveyID=None, date=None):
+        async with self.get_session() as session:
+            if(surveyID is None and date is None):
+                return (await session.scalars(select(Survey))).all()
+            if(date is not None):
+                return (await session.scalars(select(Survey).filter_by(date=date))).first()
+            return (await session.scalars(select(Survey).filter_by(surveyID=surveyID))).first()
+
+    async def getSurveyToCompleteForUser(self, username):
+        async with self.get_session() as session:
+            return (await session.scalars(
+                select(UserProgress.surveyID)
+                .filter(UserProgress.userID == username, UserProgress.survey_finished == False))).first()
+
+    async def getSurveysToCompleteForUser(self, username):
+        async with self.get_session() as session:
+            return (await session.execute(
+                select(UserProgress.surveyID)
+                .filter(UserProgress.userID == username, UserProgress.survey_finished == False))).all()
+
+    #responses
+
+    async def getResponse(self, roleID, surveyID, questionID):
+        async with self.get_session() as session:
+            return (await session.scalars(
+                select(Response)
+                .join(User)
+                .filter(User.roleID == roleID)
+                .filter(Response.surveyID == surveyID)
+                .filter(Response.questionID == questionID)
+                .order_by(Response.responseID))).all()
+
+    async def getResponsesBySurvey(self, surveyID):
+        async with self.get_session() as session:
+            return (await session.scalars(
+                select(Response).filter(Response.surveyID == surveyID).order_by(Response.responseID))).all()
+
+    async def getSurveyAnswers(self, surveyID=None):
+        query = select(SurveyAnswer.surveyID, SurveyAnswer.userID, SurveyAnswer.questionID, SurveyAnswer.choices)
+        if(surveyID is not None):
+            query = query.filter(SurveyAnswer.surveyID == surveyID)
+        async with self.get_session() as session:
+            return (await session.execute(query.order_by(SurveyAnswer.surveyAnswerID))).all()
+
+    async def getQuestionChoices(self, questionID, surveyIDs):
+        async with self.get_session() as session:
+            return (await session.execute(
+                select(SurveyAnswer.surveyID, SurveyAnswer.userID, SurveyAnswer.choices)
+                .filter(SurveyAnswer.questionID == questionID)
+                .filter(SurveyAnswer.surveyID.in_(surveyIDs)))).all()
+
+    async def getResponseMatrix(self, questionID, surveyIDs, userIDs):
+        surveyIDs = tuple(surveyIDs)
+        return responseMatrix(await self.getQuestionChoices(questionID, surveyIDs), surveyIDs, userIDs,
+                              len(await self.getAnswerOptions(questionID)))
+
+    async def calculateCategoryScores(self, surveyID, roleID=None):
+        async with self.get_session() as session:
+            totals = (await session.execute(categoryTotalsQuery(surveyID, roleID))).all()
+        return scoresFromTotals(await self.getCategories(), totals)
+
+    #score cache, see DatabaseManager.getDataStamps
+
+    async def getDataStamps(self, surveyIDs):
+        async with self.get_session() as session:
+            versions = dict((await session.execute(select(DataVersion.scope, DataVersion.version))).all())
+        ReferenceCatalog.dropIfStale(self.db_url, versions.get("scoring", 0))
+        return dataStamps(versions, surveyIDs)
+
+    async def getCachedResults(self, kind, stamps):
+        async with self.get_session() as session:
+            entries = (await session.scalars(
+                select(ScoreCacheEntry)
+                .filter(ScoreCacheEntry.kind == kind, ScoreCacheEntry.surveyID.in_(list(stamps))))).all()
+        return {entry.surveyID: json.loads(entry.payload) for entry in entries
+                if entry.stamp == stamps[entry.surveyID]}
+
+    async def storeCachedResults(self, kind, results):
+        if(results == {}):
+            return
+        async def work(session):
+            await session.execute(scoreCacheUpsert(kind, results))
+        await self.runTransaction(work)
+
+    #writes, same semantics as the DatabaseManager methods of the same name
+
+    async def addUser(self, userID, roleID, password, is_technical=False):
+        #bcrypt is slow on purpose, keep it off the event loop
+        hashed_password = await asyncio.to_thread(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt())
+        async def work(session):
+            session.add(User(userID=userID, roleID=roleID, hash_salt=hashed_password, is_technical=is_technical))
+        try:
+            await self.runTransaction(work)
+        except:
+            pass
+
+    async def createSurvey(self, date=None):
+        async def work(session):
+            survey = Survey(date=datetime.now() if date is None else date)
+            session.add(survey)
+            await session.flush()
+            return survey.surveyID
+        try:
+            return await self.runTransaction(work)
+        except:
+            return None
+
+    async def inviteUserToSurvey(self, username, surveyID):
+        async def work(session):
+            session.add(UserProgress(surveyID=surveyID, userID=username))
+        try:
+            await self.runTransaction(work)
+        except:
+            pass
+
+    async def addResponse(self, questionID, userID, response, surveyID):
+        async def work(session):
+            await session.run_sync(writeSurveyAnswers, surveyID, userID, {questionID: choices}, replace=False)
+        try:
+            choices = (await self.getCatalog()).encodeChoices(questionID, [response])
+            await self.runTransaction(work)
+        except:
+            pass
+
+    async def submitSurvey(self, userID, surveyID, answers):
+        async def work(session):
+            #the answers are written by the same code as DatabaseManager
+            await session.run_sync(writeSurveyAnswers, surveyID, userID, choices)
+            await session.execute(update(UserProgress).filter_by(userID=userID, surveyID=surveyID)
+                                  .values(survey_finished=True))
+
+        try:
+            catalog = await self.getCatalog()
+            choices = {questionID: catalog.encodeChoices(questionID, responses)
+                       for questionID, responses in answers.items()
+                       if responses != [] or catalog.isChecklist(questionID)}
+            await self.runTransaction(work)
+            return True
+        except:
+            return False
+
+    async def createSurveyWithInvitations(self, userIDs=None, roleIDs=None, is_technical=None, date=None):
+        if(date is None):
+            date = datetime.now()
+
+        async def work(session):
+            survey = Survey(date=date)
+            session.add(survey)
+            await session.flush()
+
+            invited_users = select(literal(survey.surveyID), User.userID).where(User.roleID != 'UNIVERSAL')
+            if(userIDs is not None):
+                invited_users = invited_users.where(User.userID.in_(userIDs))
+            if(roleIDs is not None):
+                invited_users = invited_users.where(User.roleID.in_(roleIDs))
+            if(is_technical is not None):
+                invited_users = invited_users.where(User.is_technical == is_technical)
+
+            await session.execute(insert(UserProgress).from_select(["surveyID", "userID"], invited_users))
+            return survey.surveyID
+
+        try:
+            return await self.runTransaction(work)
+        except:
+            return None
+
+    async def setUserFinishedSurvey(self, surveyID, userID):
+        async def work(session):
+            await session.execute(update(UserProgress).filter_by(userID=userID, surveyID=surveyID)
+                                  .values(survey_finished=True))
+        try:
+            await self.runTransaction(work)
+        except:
+            pass
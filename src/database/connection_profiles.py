@@ -0,0 +1,109 @@
+from sqlite3 import OperationalError as SQLiteOperationalError
+import threading
+
+JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SYNCHRONOUS_LEVELS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+#sqlite settings applied to every pooled connection plus the retry policy for write transactions
+class ConnectionProfile:
+
+    def __init__(self, journal_mode, synchronous, busy_timeout, max_retries, retry_backoff, cache_size, mmap_size):
+        journal_mode = journal_mode.upper()
+        synchronous = synchronous.upper()
+        if(journal_mode not in JOURNAL_MODES):
+            raise ValueError("Illegal journal mode")
+        if(synchronous not in SYNCHRONOUS_LEVELS):
+            raise ValueError("Illegal synchronous level")
+
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        #milliseconds sqlite waits for a lock before reporting "database is locked"
+        self.busy_timeout = int(busy_timeout)
+        #extra attempts for a write transaction that still failed on a lock
+        self.max_retries = int(max_retries)
+        #seconds before the first retry, doubled on every further attempt
+        self.retry_backoff = float(retry_backoff)
+        #negative values are in KiB, positive values in pages (sqlite convention)
+        self.cache_size = int(cache_size)
+        self.mmap_size = int(mmap_size)
+
+    #build a profile from the config.json entry
+    #the entry is either a profile name or an object with an optional "profile" base and overridden fields
+    @staticmethod
+    def fromConfig(entry):
+        if(isinstance(entry, str)):
+            if(entry not in PROFILES):
+                raise ValueError("Unknown connection profile")
+            return PROFILES[entry]
+
+        settings = dict(entry)
+        base = settings.pop("profile", DEFAULT_PROFILE)
+        if(base not in PROFILES):
+            raise ValueError("Unknown connection profile")
+        fields = dict(vars(PROFILES[base]))
+        for key, value in settings.items():
+            if(key not in fields):
+                raise ValueError("Unknown connection profile setting: " + key)
+            fields[key] = value
+        return ConnectionProfile(**fields)
+
+    #connect event listener, runs once for every new dbapi connection
+    def applyPragmas(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA busy_timeout = {self.busy_timeout}")
+            try:
+                cursor.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+            except SQLiteOperationalError:
+                #another client holds a lock, keep the journal mode the file already has
+                pass
+            cursor.execute(f"PRAGMA synchronous = {self.synchronous}")
+            cursor.execute(f"PRAGMA cache_size = {self.cache_size}")
+            cursor.execute(f"PRAGMA mmap_size = {self.mmap_size}")
+        finally:
+            cursor.close()
+
+
+PROFILES = {
+    #database file on a network drive shared by several respondents
+    #WAL and memory mapping rely on shared memory which network file systems don't provide
+    "shared": ConnectionProfile(journal_mode="TRUNCATE", synchronous="FULL", busy_timeout=15000,
+                                max_retries=5, retry_backoff=0.2, cache_size=-8000, mmap_size=0),
+    #database file on a local disk, possibly used by several processes on the same machine
+    "local": ConnectionProfile(journal_mode="WAL", synchronous="NORMAL", busy_timeout=5000,
+                               max_retries=3, retry_backoff=0.1, cache_size=-32000, mmap_size=268435456),
+}
+
+#safe for every deployment, "local" has to be chosen explicitly in config.json
+DEFAULT_PROFILE = "shared"
+
+
+#True if the error means another connection held the lock for longer than the busy timeout
+def isLockError(error):
+    message = str(getattr(error, "orig", error)).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+#process-wide record of lock contention on write transactions
+class ContentionStats:
+
+    _lock = threading.Lock()
+    transactions = 0
+    retries = 0
+    failures = 0
+    lock_wait_seconds = 0.0
+
+    @classmethod
+    def record(cls, retries, lock_wait_seconds, failed=False):
+        with cls._lock:
+            cls.transactions += 1
+            cls.retries += retries
+            cls.lock_wait_seconds += lock_wait_seconds
+            if(failed):
+                cls.failures += 1
+
+    @classmethod
+    def snapshot(cls):
+        with cls._lock:
+            return {"transactions": cls.transactions, "retries": cls.retries,
+                    "failures": cls.failures, "lock_wait_seconds": round(cls.lock_wait_seconds, 3)}
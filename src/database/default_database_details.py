@@ -141,6 +141,15 @@ class DefaultCategories:
         
         self.rating = ['need', 'need', 'attitude', 'attitude', 'awareness']
 
+#ratings shown with the category scores, formula is a numexpr expression over the category IDs
+class DefaultRatings:
+    def __init__(self):
+        self.ratingID = ['need', 'attitude', 'awareness']
+
+        self.name = ['Need', 'Attitude', 'Awareness']
+
+        self.formula = ['(TDU+IAB)/2', '(SPI+STA)/2', 'DSA']
+
 class DefaultAnswers:
     def __init__(self):
         
@@ -0,0 +1,74 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+import threading
+
+from database.session_tracking import TrackedSession
+from database.write_tracking import TableWriteTracker
+
+#process-wide registry of engines and session factories
+#every DatabaseManager shares one engine (and its connection pool) per database url
+#instead of building a new engine, schema check and sessionmaker on each construction
+class EngineRegistry:
+
+    _engines = {}
+    _session_factories = {}
+    _current_url = None
+    _lock = threading.Lock()
+
+    #return the engine for the given url, building it on first use
+    #the connection profile's pragmas are applied to every pooled connection
+    #setup is called once with the new engine, before it is shared with other managers
+    @classmethod
+    def getEngine(cls, db_url, profile=None, setup=None):
+        with cls._lock:
+            #the database path has been changed, drop the engines for the old path
+            if(cls._current_url is not None and cls._current_url != db_url):
+                cls._disposeAll()
+            cls._current_url = db_url
+
+            engine = cls._engines.get(db_url)
+            if(engine is not None):
+                return engine
+
+            if(profile is None):
+                engine = create_engine(db_url, echo=False)
+            else:
+                #pysqlite takes the busy timeout in seconds
+                engine = create_engine(db_url, echo=False, connect_args={"timeout": profile.busy_timeout / 1000})
+                event.listen(engine, "connect", profile.applyPragmas)
+            try:
+                if(setup is not None):
+                    setup(engine)
+            except:
+                #do not share an engine that failed to set up (e.g. non-existent path)
+                engine.dispose()
+                raise
+
+            cls._engines[db_url] = engine
+            #sessions are closed as soon as a read returns, so loaded objects must not expire
+            session_factory = sessionmaker(bind=engine, class_=TrackedSession, expire_on_commit=False)
+            #lets in-memory copies of the data know which tables a commit changed
+            TableWriteTracker.install(session_factory, db_url)
+            cls._session_factories[db_url] = session_factory
+            return engine
+
+    @classmethod
+    def getSessionFactory(cls, db_url, profile=None, setup=None):
+        cls.getEngine(db_url, profile, setup)
+        with cls._lock:
+            return cls._session_factories[db_url]
+
+    #close all pooled connections and forget the engines
+    #the next DatabaseManager will build a fresh engine
+    @classmethod
+    def dispose(cls):
+        with cls._lock:
+            cls._disposeAll()
+            cls._current_url = None
+
+    @classmethod
+    def _disposeAll(cls):
+        for engine in cls._engines.values():
+            engine.dispose()
+        cls._engines.clear()
+        cls._session_factories.clear()
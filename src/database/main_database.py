@@ -1,12 +1,25 @@
-from sqlalchemy import create_engine, Column, Boolean, Integer, String, Sequence, ForeignKey, Enum, CheckConstraint, Date
-from sqlalchemy.orm import sessionmaker, relationship, declarative_base, joinedload
+from sqlalchemy import Column, Boolean, Integer, String, Sequence, ForeignKey, Enum, CheckConstraint, Date, Index, insert, select, literal, func
+from sqlalchemy.orm import relationship, declarative_base, joinedload, selectinload
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
 from base64 import b64encode
+import json
 from datetime import datetime
 import os
+import socket
+import time
 import bcrypt
+import numpy as np
 import keyring
 
 from database.default_database_details import *
+from database.engine_registry import EngineRegistry
+from database.session_tracking import SessionLeakDetector
+from database.write_tracking import TableWriteTracker
+from database.reference_catalog import ReferenceCatalog
+from database.query_cache import QueryCache, memoized
+from database.connection_profiles import ConnectionProfile, ContentionStats, isLockError
+from database.migrations import MigrationRunner, answerOptionRows, SCORING_TABLES
 from constants import ConstantsAndUtilities
 
 
@@ -17,89 +30,210 @@ class DatabaseManager:
     def __init__(self):
         self.constants = ConstantsAndUtilities()
         db_url = "sqlite:///" + self.constants.getDatabasePath() + "/" + self.constants.database_name
-        self.engine = create_engine(db_url, echo=False)
+        self.db_url = db_url
         self.Base = DatabaseBase
-        self.Base.metadata.create_all(self.engine)
-        self.Session = sessionmaker(bind=self.engine)
+        #sqlite pragmas and write retry policy chosen in config.json
+        self.profile = ConnectionProfile.fromConfig(self.constants.getConnectionProfile())
+        #the engine, its connection pool and the session factory are shared by all managers
+        #the schema is not inspected here, see migrateDatabase
+        self.engine = EngineRegistry.getEngine(db_url, self.profile)
+        self.Session = EngineRegistry.getSessionFactory(db_url, self.profile)
+        #opt-in memoization of read methods, None unless enabled in config.json
+        self.query_cache = QueryCache.forDatabase(db_url, self.constants.getQueryCacheSettings())
         
 
     def get_session(self):
         return self.Session()
+
+    #run work(session) as one write transaction and return its result
+    #if another connection keeps the database locked past the busy timeout the whole
+    #transaction is retried with exponential backoff, up to the profile's max_retries
+    #other errors are raised straight away
+    def runTransaction(self, work):
+        lock_wait = 0.0
+        for attempt in range(self.profile.max_retries + 1):
+            with self.get_session() as session:
+                try:
+                    #take the write lock before the work runs, sqlite waits for it inside this statement
+                    #(up to the busy timeout) so the work never waits on other writers
+                    #and the time measured here is only lock wait, whether the lock is granted or not
+                    #IMMEDIATE rather than EXCLUSIVE keeps other connections reading until the commit
+                    waiting = time.monotonic()
+                    try:
+                        session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+                    finally:
+                        lock_wait += time.monotonic() - waiting
+                    result = work(session)
+                    session.commit()
+                    ContentionStats.record(attempt, lock_wait)
+                    return result
+                except OperationalError as error:
+                    session.rollback()
+                    if(not isLockError(error)):
+                        raise
+                    if(attempt == self.profile.max_retries):
+                        ContentionStats.record(attempt, lock_wait, failed=True)
+                        raise
+                except:
+                    session.rollback()
+                    raise
+            time.sleep(self.profile.retry_backoff * (2 ** attempt))
+
+    #sessions that are still open and the call sites that opened them
+    #only recorded while the leak detector is enabled
+    def getOpenSessions(self):
+        return SessionLeakDetector.openSessions()
+
+    #hit/miss counters of the read cache, None when it is disabled
+    def getQueryCacheStats(self):
+        if(self.query_cache is None):
+            return None
+        return self.query_cache.stats()
+
+    #lock waits and retries of write transactions in this process
+    def getContentionStats(self):
+        return ContentionStats.snapshot()
+
+    #append one line with this process' contention stats to the log next to the database
+    #written on exit when "contention_log" is set in config.json, runs without writes are left out
+    def logContentionStats(self):
+        stats = self.getContentionStats()
+        if(stats["transactions"] == 0):
+            return
+        line = " ".join([datetime.now().isoformat(timespec="seconds"), socket.gethostname()]
+                        + [f"{key}={value}" for key, value in stats.items()])
+        try:
+            with open(os.path.join(self.constants.getDatabasePath(), self.constants.contention_log_name), "a") as file:
+                file.write(line + "\n")
+        except OSError:
+            pass
+
+    #create or upgrade the database schema, returns the notices of the upgrade for the user (usually none)
+    #called once at startup and during the setup process, not on every construction
+    def migrateDatabase(self):
+        notices = MigrationRunner(self.engine, self.Base.metadata).upgrade()
+        #anything loaded before the upgrade may describe the old schema
+        TableWriteTracker.announce(self.db_url, self.Base.metadata.tables.keys())
+        return notices
+
+    #in-memory copy of roles, categories, answers and questions
+    #loaded on first use and reloaded after any write to those tables
+    def getCatalog(self):
+        catalog = ReferenceCatalog.get(self.db_url)
+        if(catalog is not None):
+            return catalog
+
+        generation = ReferenceCatalog.generation(self.db_url)
+        with self.get_session() as session:
+            #read first, a write between this and the tables only makes the catalog reload once more
+            scoring_version = session.query(DataVersion.version).filter(DataVersion.scope == "scoring").scalar()
+            #no ordering on roles and categories, callers rely on the insertion order
+            catalog = ReferenceCatalog(
+                roles=session.query(Role).all(),
+                categories=session.query(Category).all(),
+                answers=session.query(Answer).order_by(Answer.answerID).all(),
+                questions=session.query(Question).options(joinedload(Question.answer), joinedload(Question.category),
+                                                          selectinload(Question.options)).all(),
+                associations=session.query(QuestionRoleAssociation).all(),
+                options=session.query(AnswerOption).all(),
+                rating_formulas=session.query(RatingFormula).all(),
+                scoring_version=scoring_version or 0
+            )
+        ReferenceCatalog.store(self.db_url, catalog, generation)
+        return catalog
     
     def initialise_database(self):
 
-        session = self.get_session()
+        with self.get_session() as session:
         
-        initialise_roles(session)
+            initialise_roles(session)
+
+            initialise_categories(session)
 
-        initialise_categories(session)
+            initialise_answers(session)
 
-        initialise_answers(session)
+            initialise_questions(session)
 
-        initialise_questions(session)
+            initialise_answer_options(session)
+
+            initialise_ratings(session)
 
     
     def addRole(self, roleID, description):
-        role = Role(roleID=roleID, description=description)
-        session = self.get_session()
+        def work(session):
+            session.add(Role(roleID=roleID, description=description))
         try:
-            session.add(role)
-            session.commit()
+            self.runTransaction(work)
         except:
-            session.rollback()
-        finally:
-            session.close()
+            pass
 
     def getRole(self, roleID=None):
         if(roleID == None):
-            return self.get_session().query(Role).all()
+            return self.getCatalog().getRoles()
         
-        return self.get_session().query(Role).filter_by(roleID=roleID).first()
+        return self.getCatalog().getRole(roleID)
 
 
     def addUser(self, userID, roleID, password, is_technical=False):
         hashed_password = self.hashPassword(password)
-        user = User(userID=userID, roleID=roleID, hash_salt=hashed_password, is_technical=is_technical)
-        session = self.get_session()
-
+        def work(session):
+            session.add(User(userID=userID, roleID=roleID, hash_salt=hashed_password, is_technical=is_technical))
         try:
-            session.add(user)
-            session.commit()
+            self.runTransaction(work)
         except:
-            session.rollback()
-        finally:
-            session.close()
+            pass
 
     def createSurvey(self, date=None):
-        if(date is None):
-            survey = Survey(date=datetime.now())
-        else:
-            survey = Survey(date=date)
-
-        with self.get_session() as session:
-            try:
-                session.add(survey)
-                session.commit()
-                return survey.surveyID
-            except:
-                session.rollback()
+        def work(session):
+            survey = Survey(date=datetime.now() if date is None else date)
+            session.add(survey)
+            session.flush()
+            return survey.surveyID
+        try:
+            return self.runTransaction(work)
+        except:
+            return None
 
+    #add one chosen option to the user's answer of a question
     def addResponse(self, questionID, userID, response, surveyID):
-        with self.get_session() as session:
-            new_response = Response(questionID=questionID, userID=userID, response=response, surveyID=surveyID)
-            session.add(new_response)
-            try:
-                session.commit()
-            except:
-                session.rollback()
+        def work(session):
+            choices = self.getCatalog().encodeChoices(questionID, [response])
+            writeSurveyAnswers(session, surveyID, userID, {questionID: choices}, replace=False)
+        try:
+            self.runTransaction(work)
+        except:
+            pass
+
+    #store a complete survey submission in one transaction
+    #answers maps questionID to the list of chosen answer texts, stored as one bitmask row per question
+    #resubmitting replaces the previous answers, submitting the same answers again changes nothing
+    #returns False if nothing was stored
+    def submitSurvey(self, userID, surveyID, answers):
+        def work(session):
+            writeSurveyAnswers(session, surveyID, userID, choices)
+            session.query(UserProgress).filter_by(userID=userID, surveyID=surveyID).update({"survey_finished":True})
 
+        try:
+            catalog = self.getCatalog()
+            #a checklist with nothing ticked is an answer (0), other questions without a response are left out
+            choices = {questionID: catalog.encodeChoices(questionID, responses)
+                       for questionID, responses in answers.items()
+                       if responses != [] or catalog.isChecklist(questionID)}
+            self.runTransaction(work)
+            return True
+        except:
+            return False
+
+    @memoized('surveys')
     def getSurvey(self, surveyID=None, date=None):
-        if(surveyID is None and date is None):
-            return self.get_session().query(Survey).all()
-        if(date is not None):
-            return self.get_session().query(Survey).filter_by(date=date).first()
-        return self.get_session().query(Survey).filter_by(surveyID=surveyID).first()
+        with self.get_session() as session:
+            if(surveyID is None and date is None):
+                return session.query(Survey).all()
+            if(date is not None):
+                return session.query(Survey).filter_by(date=date).first()
+            return session.query(Survey).filter_by(surveyID=surveyID).first()
     
+    @memoized('user_progress')
     def getSurveyToCompleteForUser(self, username):
         with self.get_session() as session:
             survey = (session.query(UserProgress.surveyID)
@@ -110,6 +244,7 @@ class DatabaseManager:
             else:
                 return None
             
+    @memoized('user_progress')
     def getSurveysToCompleteForUser(self, username):
         with self.get_session() as session:
             survey = (session.query(UserProgress.surveyID)
@@ -118,21 +253,50 @@ class DatabaseManager:
             return survey
 
     def inviteUserToSurvey(self, username, surveyID):
-        progress = UserProgress(surveyID=surveyID, userID=username)
-        with self.get_session() as session:
-            try:
-                session.add(progress)
-                session.commit()
-            except:
-                session.rollback()
+        def work(session):
+            session.add(UserProgress(surveyID=surveyID, userID=username))
+        try:
+            self.runTransaction(work)
+        except:
+            pass
+
+    #create a survey and invite all matching users in one transaction
+    #users are given as a list of userIDs and/or selected by role and technicality,
+    #the invitations are written with a single INSERT ... SELECT over the users table
+    #administrators (UNIVERSAL role) are never invited
+    #returns the new surveyID or None if nothing was stored
+    def createSurveyWithInvitations(self, userIDs=None, roleIDs=None, is_technical=None, date=None):
+        if(date is None):
+            date = datetime.now()
+
+        def work(session):
+            survey = Survey(date=date)
+            session.add(survey)
+            session.flush()
+
+            invited_users = select(literal(survey.surveyID), User.userID).where(User.roleID != 'UNIVERSAL')
+            if(userIDs is not None):
+                invited_users = invited_users.where(User.userID.in_(userIDs))
+            if(roleIDs is not None):
+                invited_users = invited_users.where(User.roleID.in_(roleIDs))
+            if(is_technical is not None):
+                invited_users = invited_users.where(User.is_technical == is_technical)
+
+            session.execute(insert(UserProgress).from_select(["surveyID", "userID"], invited_users))
+            return survey.surveyID
+
+        try:
+            return self.runTransaction(work)
+        except:
+            return None
 
     def setUserFinishedSurvey(self, surveyID, userID):
-        with self.get_session() as session:
-            try:
-                session.query(UserProgress).filter_by(userID=userID, surveyID=surveyID).update({"survey_finished":True})
-                session.commit()
-            except:
-                session.rollback()
+        def work(session):
+            session.query(UserProgress).filter_by(userID=userID, surveyID=surveyID).update({"survey_finished":True})
+        try:
+            self.runTransaction(work)
+        except:
+            pass
             
 
     #encryption and verification functions
@@ -158,38 +322,38 @@ class DatabaseManager:
         #encoding to ensure all the random bytes can later be retrieved as keyring.get_password uses utf-8 encoding
         keyring.set_password(self.constants.keyring_service_name, self.constants.keyring_user_name, b64encode(os.urandom(32)).decode(encoding='UTF-8'))
         token = keyring.get_password(self.constants.keyring_service_name, self.constants.keyring_user_name)
-        with self.get_session() as session:
-            try:
-                session.query(User).filter_by(userID=userID).update({"token":token})
-                session.commit()
-            except:
-                session.rollback()
+        def work(session):
+            session.query(User).filter_by(userID=userID).update({"token":token})
+        try:
+            self.runTransaction(work)
+        except:
+            pass
 
     def closeSessionToken(self):
 
         user = self.getUser(token=keyring.get_password(self.constants.keyring_service_name, self.constants.keyring_user_name))
         keyring.delete_password(self.constants.keyring_service_name, self.constants.keyring_user_name)
         if(user is not None):
-            with self.get_session() as session:
-                try:
-                    session.query(User).filter_by(userID=user.userID).update({"token":None})
-                    session.commit()
-                except:
-                    session.rollback()
+            def work(session):
+                session.query(User).filter_by(userID=user.userID).update({"token":None})
+            try:
+                self.runTransaction(work)
+            except:
+                pass
 
     def updatePassword(self, userID, new_password):
         user = self.getUser(userID=userID)
         hashed_password = self.hashPassword(new_password)
         if(user is not None):
             self.closeSessionToken()
-            
-            with self.get_session() as session:
-                try:
-                    session.query(User).filter_by(userID=user.userID).update({"hash_salt":hashed_password})
-                    session.commit()
-                    self.openSessionToken(userID)
-                except:
-                    session.rollback()
+
+            def work(session):
+                session.query(User).filter_by(userID=user.userID).update({"hash_salt":hashed_password})
+            try:
+                self.runTransaction(work)
+            except:
+                return
+            self.openSessionToken(userID)
 
 
     def hashPassword(self, password):
@@ -204,58 +368,59 @@ class DatabaseManager:
         return hashed_token
     #######################################################################
     
+    @memoized('users')
     def getUser(self, userID=None, token="no_token"):
         if(token is None):
             return None
-        if(token != "no_token"):
-            return self.get_session().query(User).filter_by(token=token).first()
-        if(userID == None):
-            return self.get_session().query(User).all()
-        return self.get_session().query(User).filter_by(userID=userID).first()
+        with self.get_session() as session:
+            if(token != "no_token"):
+                return session.query(User).filter_by(token=token).first()
+            if(userID == None):
+                return session.query(User).all()
+            return session.query(User).filter_by(userID=userID).first()
     
     def getCurrentUser(self):
         token = keyring.get_password(self.constants.keyring_service_name, self.constants.keyring_user_name)
         return self.getUser(token=token)
     
+    @memoized('users')
     def getUsersByTechnicality(self, is_technical):
-        return self.get_session().query(User).filter_by(is_technical=is_technical).all()
+        with self.get_session() as session:
+            return session.query(User).filter_by(is_technical=is_technical).all()
     
+    #reference data getters are served by the in-memory catalog, see getCatalog
     def getCategories(self):
-        return self.get_session().query(Category).all()
+        return self.getCatalog().getCategories()
     
     def getCategory(self, categoryID):
-        return self.get_session().query(Category).filter_by(categoryID=categoryID).first()
+        return self.getCatalog().getCategory(categoryID)
     
     def getQuestionsForRole(self, roleID):
-        return self.get_session().query(Question).options(joinedload(Question.answer), joinedload(Question.category)).join(QuestionRoleAssociation).filter(QuestionRoleAssociation.roleID == roleID).order_by(Question.questionID).all()
+        return self.getCatalog().getQuestionsForRole(roleID)
     
     def getQuestionsByCategory(self, categoryID = None, category_name = None):
         if(categoryID is not None):
-            return self.get_session().query(Question).options(joinedload(Question.answer)).filter_by(categoryID=categoryID).order_by(Question.questionID).all()
+            return self.getCatalog().getQuestionsByCategory(categoryID)
         elif(category_name is not None):
-            return self.get_session().query(Question).options(joinedload(Question.answer)).join(Category, Question.categoryID == Category.categoryID).filter(Category.name == category_name).order_by(Question.questionID).all()
+            category = self.getCatalog().getCategory(name=category_name)
+            if(category is None):
+                return []
+            return self.getCatalog().getQuestionsByCategory(category.categoryID)
     
     def getQuestions(self):
-        return self.get_session().query(Question).order_by(Question.questionID).all()
+        return self.getCatalog().getQuestions()
     
     def getQuestion(self, qID = None, qText = None):
         if(qID is not None):
-            return self.get_session().query(Question).options(joinedload(Question.answer)).filter_by(questionID=qID).first()
+            return self.getCatalog().getQuestion(questionID=qID)
         elif(qText is not None):
-            return self.get_session().query(Question).options(joinedload(Question.answer)).filter_by(text=qText).first()
+            return self.getCatalog().getQuestion(text=qText)
     
     
     def getQuestionsForRoleByCategory(self, roleID, categoryID):
-        return (
-                self.get_session().query(Question)
-                .join(QuestionRoleAssociation)
-                .filter(QuestionRoleAssociation.roleID == roleID)
-                .filter(Question.categoryID == categoryID)
-                .options(joinedload(Question.answer))
-                .order_by(Question.questionID)
-                .all()
-            )
+        return self.getCatalog().getQuestionsForRoleByCategory(roleID, categoryID)
     
+    @memoized('survey_answers', 'answer_options', 'users')
     def getResponse(self, roleID, surveyID, questionID):
         with self.get_session() as session:
             return (
@@ -269,30 +434,97 @@ class DatabaseManager:
             )
         
         
+    @memoized('survey_answers', 'answer_options')
     def getResponsesBySurvey(self, surveyID):
         with self.get_session() as session:
             return (
                 session.query(Response)
                 .filter(Response.surveyID == surveyID)
+                .order_by(Response.responseID)
                 .all()
             )
-        
-        
-    def getAnswer(self, answerID):
+
+    #(userID, questionID, choices) rows of the compact answer encoding, for one survey or all of them
+    @memoized('survey_answers')
+    def getSurveyAnswers(self, surveyID=None):
         with self.get_session() as session:
-            return (
-                session.query(Answer)
-                .filter(Answer.answerID == answerID)
-                .first()
-            )
-        
-    def getAnswers(self):
+            query = session.query(SurveyAnswer.surveyID, SurveyAnswer.userID, SurveyAnswer.questionID,
+                                  SurveyAnswer.choices)
+            if(surveyID is not None):
+                query = query.filter(SurveyAnswer.surveyID == surveyID)
+            return query.order_by(SurveyAnswer.surveyAnswerID).all()
+
+    #(surveyID, userID, choices) rows of one question's answers in the given surveys, surveyIDs is a tuple
+    @memoized('survey_answers')
+    def getQuestionChoices(self, questionID, surveyIDs):
         with self.get_session() as session:
             return (
-                session.query(Answer)
-                .order_by(Answer.answerID)
+                session.query(SurveyAnswer.surveyID, SurveyAnswer.userID, SurveyAnswer.choices)
+                .filter(SurveyAnswer.questionID == questionID)
+                .filter(SurveyAnswer.surveyID.in_(surveyIDs))
                 .all()
             )
+
+    #answers to a question as a (surveys x users x options) array of 0/1, options ordered by ordinal
+    #matrix[s, u, o] is 1 if userIDs[u] chose the option with ordinal o in surveyIDs[s], read in one query
+    def getResponseMatrix(self, questionID, surveyIDs, userIDs):
+        surveyIDs = tuple(surveyIDs)
+        return responseMatrix(self.getQuestionChoices(questionID, surveyIDs), surveyIDs, userIDs,
+                              len(self.getAnswerOptions(questionID)))
+
+    #{categoryID: score} of a survey from the stored answers in one GROUP BY query, roleID limits it to one role
+    #ThreadedScoreCalculator is the Python reference of the same rules
+    @memoized('survey_answers', 'answer_options', 'questions', 'users', 'categories')
+    def calculateCategoryScores(self, surveyID, roleID=None):
+        with self.get_session() as session:
+            totals = session.execute(categoryTotalsQuery(surveyID, roleID)).all()
+        return scoresFromTotals(self.getCategories(), totals)
+
+    #stamp of the data a survey's scores are computed from as {surveyID: stamp}
+    #it changes whenever the survey's answers or the answer options, questions, categories or rating formulas are written
+    def getDataStamps(self, surveyIDs):
+        with self.get_session() as session:
+            versions = dict(session.query(DataVersion.scope, DataVersion.version).all())
+        #the results are computed from the catalog and cached reads, which only see this process' writes
+        ReferenceCatalog.dropIfStale(self.db_url, versions.get("scoring", 0))
+        if(self.query_cache is not None):
+            self.query_cache.syncDataVersions(versions, scopeTables)
+        return dataStamps(versions, surveyIDs)
+
+    #cached results of the given kind as {surveyID: result}, only for surveys whose entry matches the stamp
+    def getCachedResults(self, kind, stamps):
+        with self.get_session() as session:
+            entries = (session.query(ScoreCacheEntry)
+                       .filter(ScoreCacheEntry.kind == kind, ScoreCacheEntry.surveyID.in_(list(stamps)))
+                       .all())
+        return {entry.surveyID: json.loads(entry.payload) for entry in entries
+                if entry.stamp == stamps[entry.surveyID]}
+
+    #results as {surveyID: (stamp, result)}, result has to be JSON serialisable
+    #a result computed from data written since the stamp was read keeps the old stamp and is never returned
+    def storeCachedResults(self, kind, results):
+        if(results == {}):
+            return
+        def work(session):
+            session.execute(scoreCacheUpsert(kind, results))
+        self.runTransaction(work)
+        
+        
+    def getAnswer(self, answerID):
+        return self.getCatalog().getAnswer(answerID)
+        
+    def getAnswers(self):
+        return self.getCatalog().getAnswers()
+
+    def getRatingFormulas(self):
+        return self.getCatalog().getRatingFormulas()
+
+    #options of a question ordered by ordinal
+    def getAnswerOptions(self, questionID):
+        return self.getCatalog().getAnswerOptions(questionID)
+
+    def getAnswerOption(self, questionID, text=None, ordinal=None):
+        return self.getCatalog().getAnswerOption(questionID, text=text, ordinal=ordinal)
         
 
     def checkUsernameUnique(self, username):
@@ -327,6 +559,7 @@ class Question(DatabaseBase):
     answer = relationship('Answer', back_populates='questions')
     role_specific_wording = relationship('RoleSpecificQuestionWording', back_populates='questions')
     response = relationship('Response', back_populates='questions')
+    options = relationship('AnswerOption', back_populates='question', order_by='AnswerOption.ordinal')
 
     __table_args__ = (
         CheckConstraint('weight >= 0 AND weight <= 2', name='check_value_range'),
@@ -355,6 +588,15 @@ class Category(DatabaseBase):
     rating = Column(String(10))
     questions = relationship('Question', back_populates='category')
 
+#a rating shown with the category scores, formula is a numexpr expression over category IDs
+#e.g. (TDU+IAB)/2, see scoring/ratings.py, position orders the ratings for display
+class RatingFormula(DatabaseBase):
+    __tablename__ = 'rating_formulas'
+    ratingID = Column(String(10), primary_key=True)
+    name = Column(String(), nullable=False)
+    formula = Column(String(), nullable=False)
+    position = Column(Integer, nullable=False, default=0)
+
 class Answer(DatabaseBase):
 
     class TypeEnum(Enum):
@@ -369,6 +611,24 @@ class Answer(DatabaseBase):
     questions = relationship('Question', back_populates='answer')
 
 
+#one row per answer option of a question, ordinal is the position in the answer list (from 0)
+#weight is the option's score, for checklist questions it's the +1/-1 polarity of every option
+#options that don't count towards the category score (checklists and weight 0) have scored False
+class AnswerOption(DatabaseBase):
+    __tablename__ = 'answer_options'
+    optionID = Column(Integer, Sequence("answer_option_id_seq"), primary_key=True, autoincrement=True)
+    questionID = Column(Integer, ForeignKey('questions.questionID'), nullable=False)
+    ordinal = Column(Integer, nullable=False)
+    text = Column(String(), nullable=False)
+    weight = Column(Integer)
+    scored = Column(Boolean, default=False)
+    question = relationship('Question', back_populates='options')
+
+    __table_args__ = (
+        Index('ux_answer_options_question_ordinal', 'questionID', 'ordinal', unique=True),
+        Index('ux_answer_options_question_text', 'questionID', 'text', unique=True),
+    )
+
 class Role(DatabaseBase):
     __tablename__ = 'roles'
     roleID = Column(String(), primary_key=True)
@@ -382,23 +642,62 @@ class QuestionRoleAssociation(DatabaseBase):
     questionID = Column(Integer, ForeignKey('questions.questionID'), primary_key=True)
     roleID = Column(String(), ForeignKey('roles.roleID'), primary_key=True)
 
+#one row per chosen answer option, mapped onto the responses view over survey_answers
+#kept for readers of the old table layout, answers are written through SurveyAnswer
 class Response(DatabaseBase):
     __tablename__ = 'responses'
     responseID = Column(Integer, Sequence("response_id_seq"), primary_key=True, autoincrement=True)
     questionID = Column(Integer, ForeignKey('questions.questionID'))
-    userID = Column(Integer, ForeignKey('users.userID'))
+    userID = Column(String(), ForeignKey('users.userID'))
     response = Column(String())
     surveyID = Column(Integer, ForeignKey('surveys.surveyID'))
     questions = relationship('Question', back_populates='response')
     user = relationship('User', back_populates='response')
     survey = relationship('Survey', back_populates='response')
 
+    #see RESPONSES_VIEW in database/migrations.py
+    __table_args__ = {'info': {'is_view': True}}
+
+#one row per (survey, user, question), choices is a bitmask of the chosen answer option ordinals
+#(bit n set means the option with ordinal n was chosen), single choice answers have one bit set
+#and a checklist answered with nothing ticked is stored as 0
+class SurveyAnswer(DatabaseBase):
+    __tablename__ = 'survey_answers'
+    surveyAnswerID = Column(Integer, Sequence("survey_answer_id_seq"), primary_key=True, autoincrement=True)
+    surveyID = Column(Integer, ForeignKey('surveys.surveyID'), nullable=False)
+    userID = Column(String(), ForeignKey('users.userID'), nullable=False)
+    questionID = Column(Integer, ForeignKey('questions.questionID'), nullable=False)
+    choices = Column(Integer, nullable=False)
+
+    #ux_survey_answers_submission is the conflict target of submitSurvey and serves per survey and per user reads
+    #ix_survey_answers_survey_question serves getResponse
+    __table_args__ = (
+        Index('ux_survey_answers_submission', 'surveyID', 'userID', 'questionID', unique=True),
+        Index('ix_survey_answers_survey_question', 'surveyID', 'questionID'),
+    )
+
+#write counters, see migrations.dataVersionTriggers for the scopes
+#only ever written by triggers
+class DataVersion(DatabaseBase):
+    __tablename__ = 'data_versions'
+    scope = Column(String(), primary_key=True)
+    version = Column(Integer, nullable=False)
+
+#computed per survey results stored as JSON, reused while the stamp matches DatabaseManager.getDataStamps
+#kind names the computation, e.g. "scores"
+class ScoreCacheEntry(DatabaseBase):
+    __tablename__ = 'score_cache'
+    surveyID = Column(Integer, ForeignKey('surveys.surveyID'), primary_key=True)
+    kind = Column(String(), primary_key=True)
+    stamp = Column(String(), nullable=False)
+    payload = Column(String(), nullable=False)
+
 class User(DatabaseBase):
     __tablename__ = 'users'
     userID = Column(String(), primary_key=True)
     roleID = Column(String(), ForeignKey('roles.roleID'))
     hash_salt = Column(String())
-    token = Column(String())
+    token = Column(String(), index=True)
     is_technical = Column(Boolean, default=False)
     role = relationship('Role', back_populates='user')
     response = relationship('Response', back_populates='user')
@@ -419,6 +718,11 @@ class UserProgress(DatabaseBase):
     survey = relationship('Survey', back_populates='progress')
     user = relationship('User', back_populates='progress')
 
+    #covers the surveys-to-complete lookups by user
+    __table_args__ = (
+        Index('ix_user_progress_user_finished', 'userID', 'survey_finished', 'surveyID'),
+    )
+
 def initialise_roles(session):
     defaultRoles = DefaultRoles()
     role_list = []
@@ -449,6 +753,22 @@ def initialise_categories(session):
     finally:
         session.close()
 
+def initialise_ratings(session):
+    defaultRatings = DefaultRatings()
+    rating_list = []
+
+    for i in range(0, len(defaultRatings.ratingID)):
+        rating_list.append(RatingFormula(ratingID=defaultRatings.ratingID[i], name=defaultRatings.name[i],
+                                         formula=defaultRatings.formula[i], position=i))
+
+    try:
+        session.add_all(rating_list)
+        session.commit()
+    except:
+        session.rollback()
+    finally:
+        session.close()
+
 def initialise_answers(session):
     answer_list = []
     defaultAnswers = DefaultAnswers()
@@ -468,6 +788,112 @@ def initialise_answers(session):
         session.close()
 
 
+#store a user's answers to a survey in the caller's transaction
+#choices maps questionID to the option bitmask, with replace questions missing from it are removed,
+#otherwise the bits are added to the stored answers
+#also used by AsyncDatabaseManager through run_sync
+def writeSurveyAnswers(session, surveyID, userID, choices, replace=True):
+    old = dict(session.query(SurveyAnswer.questionID, SurveyAnswer.choices)
+               .filter(SurveyAnswer.surveyID == surveyID, SurveyAnswer.userID == userID).all())
+    if(replace):
+        new = dict(choices)
+    else:
+        new = dict(old)
+        for questionID, bits in choices.items():
+            new[questionID] = old.get(questionID, 0) | bits
+
+    removed = [questionID for questionID in old if questionID not in new]
+    if(removed != []):
+        (session.query(SurveyAnswer)
+         .filter(SurveyAnswer.surveyID == surveyID, SurveyAnswer.userID == userID,
+                 SurveyAnswer.questionID.in_(removed))
+         .delete(synchronize_session=False))
+
+    changed = [{"surveyID": surveyID, "userID": userID, "questionID": questionID, "choices": bits}
+               for questionID, bits in new.items() if old.get(questionID) != bits]
+    if(changed != []):
+        upsert = sqlite_insert(SurveyAnswer)
+        session.execute(upsert.on_conflict_do_update(index_elements=["surveyID", "userID", "questionID"],
+                                                     set_={"choices": upsert.excluded.choices}), changed)
+
+#(categoryID, sum, count) of the scored answer weights of a survey, roleID limits it to the users of one role
+#a chosen option is a set bit of survey_answers.choices, so the join on answer_options expands the bitmasks
+def categoryTotalsQuery(surveyID, roleID=None):
+    query = (select(Question.categoryID, func.sum(AnswerOption.weight), func.count())
+             .select_from(SurveyAnswer)
+             .join(Question, Question.questionID == SurveyAnswer.questionID)
+             .join(AnswerOption, (AnswerOption.questionID == SurveyAnswer.questionID)
+                   & SurveyAnswer.choices.op('>>')(AnswerOption.ordinal).op('&')(1).bool_op('!=')(0))
+             .where(SurveyAnswer.surveyID == surveyID, AnswerOption.scored == True))
+    if(roleID is not None):
+        query = query.join(User, User.userID == SurveyAnswer.userID).where(User.roleID == roleID)
+    return query.group_by(Question.categoryID)
+
+#{categoryID: score} for every category from (categoryID, sum, count) rows, 0.0 for categories without answers
+def scoresFromTotals(categories, totals):
+    totals = {categoryID: (score_sum, score_count) for categoryID, score_sum, score_count in totals}
+    scores = {}
+    for category in categories:
+        score_sum, score_count = totals.get(category.categoryID, (0, 0))
+        scores[category.categoryID] = round(score_sum/score_count, 2) if score_count > 0 else 0.0
+    return scores
+
+#answers to a question as a (surveys x users x options) array of 0/1, see DatabaseManager.getResponseMatrix
+#rows are the question's (surveyID, userID, choices) rows, answers of users that aren't asked for are skipped
+def responseMatrix(rows, surveyIDs, userIDs, num_options):
+    userIDs = list(userIDs)
+    matrix = np.zeros((len(surveyIDs), len(userIDs), num_options), dtype=np.int64)
+    if(rows == [] or num_options == 0):
+        return matrix
+
+    survey_index = {surveyID: index for index, surveyID in enumerate(surveyIDs)}
+    user_index = {userID: index for index, userID in enumerate(userIDs)}
+    rows = [row for row in rows if row.userID in user_index]
+    if(rows == []):
+        return matrix
+    surveys = np.array([survey_index[row.surveyID] for row in rows])
+    users = np.array([user_index[row.userID] for row in rows])
+    choices = np.array([row.choices for row in rows], dtype=np.int64)
+
+    #bit n of choices is the option with ordinal n
+    matrix[surveys, users] = (choices[:, None] >> np.arange(num_options)) & 1
+    return matrix
+
+#{surveyID: stamp} from the {scope: version} rows of data_versions
+def dataStamps(versions, surveyIDs):
+    scoring_version = versions.get("scoring", 0)
+    return {surveyID: f"{versions.get(f'answers:{surveyID}', 0)}.{scoring_version}" for surveyID in surveyIDs}
+
+#tables whose writes bump the data_versions scope
+def scopeTables(scope):
+    if(scope == "scoring"):
+        return SCORING_TABLES
+    return ["survey_answers"]
+
+#insert or replace score_cache entries, results is {surveyID: (stamp, result)}
+def scoreCacheUpsert(kind, results):
+    statement = sqlite_insert(ScoreCacheEntry).values([
+        {"surveyID": surveyID, "kind": kind, "stamp": stamp, "payload": json.dumps(result)}
+        for surveyID, (stamp, result) in results.items()])
+    return statement.on_conflict_do_update(
+        index_elements=[ScoreCacheEntry.surveyID, ScoreCacheEntry.kind],
+        set_={"stamp": statement.excluded.stamp, "payload": statement.excluded.payload})
+
+#split the answer texts and weights of every question into answer options
+def initialise_answer_options(session):
+    rows = []
+    for question in session.query(Question).options(joinedload(Question.answer)).all():
+        rows += answerOptionRows(question.questionID, question.answer.answer, question.answer_weights)
+    try:
+        if(rows != []):
+            session.execute(insert(AnswerOption), rows)
+        session.commit()
+    except:
+        session.rollback()
+    finally:
+        session.close()
+
+
 def initialise_questions(session):
 
     #find audiences
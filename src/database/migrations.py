@@ -0,0 +1,358 @@
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, inspect, select, func, insert
+from datetime import datetime
+import threading
+
+from database.default_database_details import DefaultRatings
+
+#bookkeeping table with one row per applied schema version
+#kept outside of the ORM models so that it never changes shape between releases
+version_metadata = MetaData()
+schema_version_table = Table(
+    'schema_version', version_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String()),
+    Column('applied_at', DateTime)
+)
+
+#version of the schema created by releases that predate migrations
+BASELINE_VERSION = 1
+
+#read-only view with one row per chosen answer option, the layout of the old responses table
+#responseID is derived from the survey_answers row and the option ordinal, it keeps insertion order
+RESPONSES_VIEW = """
+    CREATE VIEW responses AS
+    SELECT sa."surveyAnswerID" * 64 + ao.ordinal AS "responseID",
+           sa."questionID" AS "questionID",
+           sa."userID" AS "userID",
+           ao.text AS response,
+           sa."surveyID" AS "surveyID"
+    FROM survey_answers sa
+    JOIN answer_options ao ON ao."questionID" = sa."questionID" AND (sa.choices >> ao.ordinal) & 1"""
+
+#views in creation order, models mapped onto them have info={"is_view": True} and are skipped by create_all
+VIEWS = [RESPONSES_VIEW]
+
+#data_versions holds a counter per scope that the triggers below bump on every write
+#"answers:<surveyID>" counts writes to a survey's answers, "scoring" writes to the SCORING_TABLES
+#triggers so that edits made outside the application change the versions as well
+def bumpVersion(scope):
+    return f"""
+        INSERT INTO data_versions (scope, version) VALUES ({scope}, 1)
+        ON CONFLICT (scope) DO UPDATE SET version = version + 1;"""
+
+def answerVersionTriggers():
+    old_survey = bumpVersion("'answers:' || OLD.\"surveyID\"")
+    new_survey = bumpVersion("'answers:' || NEW.\"surveyID\"")
+    return [
+        f"""
+        CREATE TRIGGER survey_answers_insert_version AFTER INSERT ON survey_answers
+        BEGIN{new_survey}
+        END""",
+        f"""
+        CREATE TRIGGER survey_answers_update_version AFTER UPDATE ON survey_answers
+        BEGIN{old_survey}{new_survey}
+        END""",
+        f"""
+        CREATE TRIGGER survey_answers_delete_version AFTER DELETE ON survey_answers
+        BEGIN{old_survey}
+        END"""
+    ]
+
+def scoringVersionTriggers(tables):
+    triggers = []
+    for table in tables:
+        for operation in ["INSERT", "UPDATE", "DELETE"]:
+            triggers.append(f"""
+        CREATE TRIGGER {table}_{operation.lower()}_version AFTER {operation} ON {table}
+        BEGIN{bumpVersion("'scoring'")}
+        END""")
+    return triggers
+
+#tables the scores and ratings are computed with, besides the answers
+SCORING_TABLES = ["answer_options", "questions", "categories", "rating_formulas"]
+
+#triggers in creation order, created after the tables and views
+TRIGGERS = answerVersionTriggers() + scoringVersionTriggers(SCORING_TABLES)
+
+#ordered list of (version, description, function) entries
+#every function receives a connection inside the upgrade transaction
+#and may return a notice for the user about data it couldn't carry over
+MIGRATIONS = []
+
+def migration(version, description):
+    def register(function):
+        MIGRATIONS.append((version, description, function))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return function
+    return register
+
+#raised by MigrationRunner.upgrade when a migration fails, nothing of the upgrade is kept
+class MigrationError(Exception):
+    def __init__(self, version, description, error):
+        super().__init__(f"Migration {version} ({description}) failed: {error}")
+        self.version = version
+        self.description = description
+        self.error = error
+
+def latestVersion():
+    if(MIGRATIONS == []):
+        return BASELINE_VERSION
+    return max(BASELINE_VERSION, MIGRATIONS[-1][0])
+
+#answer_options rows for one question from its ';' separated answer text and ',' separated weights
+#a checklist question has a single "+1" or "-1" that applies to every option
+#checklist options and options weighted 0 are not scored
+def answerOptionRows(questionID, answer_text, answer_weights):
+    texts = answer_text.split(';')
+    if(answer_weights in ("+1", "-1")):
+        weights = [answer_weights] * len(texts)
+    else:
+        weights = answer_weights.split(',')
+
+    rows = []
+    for ordinal, text in enumerate(texts):
+        weight = weights[ordinal] if ordinal < len(weights) else None
+        rows.append({"questionID": questionID, "ordinal": ordinal, "text": text,
+                     "weight": None if weight is None else int(weight),
+                     "scored": weight not in (None, "+1", "0", "-1")})
+    return rows
+
+#+1 or -1 for a checklist question, whose options all carry that weight without being scored, 0 otherwise
+#options are the question's (weight, scored) pairs, e.g. from answer_options or answerOptionRows
+def checklistPolarity(options):
+    options = list(options)
+    if(options == [] or any(scored for weight, scored in options)):
+        return 0
+    weights = {weight for weight, scored in options}
+    if(weights == {1} or weights == {-1}):
+        return weights.pop()
+    return 0
+
+
+class MigrationRunner:
+
+    #database urls already brought up to date by this process
+    _upgraded_urls = set()
+    _lock = threading.Lock()
+
+    def __init__(self, engine, metadata):
+        self.engine = engine
+        self.metadata = metadata
+
+    #bring the database up to the latest schema version
+    #new databases are created from the models directly, older files are upgraded in place
+    #returns the notices of the migrations that ran, empty if there is nothing to tell the user
+    def upgrade(self):
+        db_url = str(self.engine.url)
+        self.notices = []
+        with self._lock:
+            if(db_url in self._upgraded_urls):
+                return []
+            with self.engine.begin() as connection:
+                #take the write lock first so two instances sharing the file
+                #can't run the same migration at once, and DDL is rolled back on failure
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+                self._upgrade(connection)
+            self._upgraded_urls.add(db_url)
+        return self.notices
+
+    def getVersion(self):
+        with self.engine.connect() as connection:
+            if(not inspect(connection).has_table(schema_version_table.name)):
+                return None
+            return connection.execute(select(func.max(schema_version_table.c.version))).scalar()
+
+    def _upgrade(self, connection):
+        tables = inspect(connection).get_table_names()
+
+        if(schema_version_table.name not in tables):
+            version_metadata.create_all(connection)
+            if('users' in tables):
+                #database created before versioning was introduced
+                self._stamp(connection, BASELINE_VERSION, "baseline schema")
+            else:
+                #empty database, the models already describe the latest schema
+                self.metadata.create_all(connection, tables=[table for table in self.metadata.sorted_tables
+                                                             if not table.info.get("is_view")])
+                for statement in VIEWS + TRIGGERS:
+                    connection.exec_driver_sql(statement)
+                self._stamp(connection, latestVersion(), "initial schema")
+                return
+
+        current_version = connection.execute(select(func.max(schema_version_table.c.version))).scalar()
+
+        for version, description, function in MIGRATIONS:
+            if(version <= current_version):
+                continue
+            try:
+                notice = function(connection)
+            except Exception as error:
+                raise MigrationError(version, description, error) from error
+            if(notice is not None):
+                self.notices.append(notice)
+            self._stamp(connection, version, description)
+
+    def _stamp(self, connection, version, description):
+        connection.execute(insert(schema_version_table).values(version=version, description=description,
+                                                               applied_at=datetime.now()))
+
+
+#######################################################################
+#migrations, in version order
+
+@migration(2, "response and progress indexes, text responses.userID")
+def addAccessPathIndexes(connection):
+    #responses.userID was declared INTEGER while users.userID is text
+    #sqlite can't change a column type in place so the table is rebuilt
+    connection.exec_driver_sql("""
+        CREATE TABLE responses_new (
+            "responseID" INTEGER NOT NULL,
+            "questionID" INTEGER,
+            "userID" VARCHAR,
+            response VARCHAR,
+            "surveyID" INTEGER,
+            PRIMARY KEY ("responseID"),
+            FOREIGN KEY("questionID") REFERENCES questions ("questionID"),
+            FOREIGN KEY("userID") REFERENCES users ("userID"),
+            FOREIGN KEY("surveyID") REFERENCES surveys ("surveyID")
+        )""")
+    connection.exec_driver_sql("""
+        INSERT INTO responses_new ("responseID", "questionID", "userID", response, "surveyID")
+        SELECT "responseID", "questionID", CAST("userID" AS TEXT), response, "surveyID" FROM responses""")
+    connection.exec_driver_sql("DROP TABLE responses")
+    connection.exec_driver_sql("ALTER TABLE responses_new RENAME TO responses")
+
+    #getResponse and getResponsesBySurvey
+    connection.exec_driver_sql('CREATE INDEX ix_responses_survey_question_user ON responses ("surveyID", "questionID", "userID")')
+    connection.exec_driver_sql('CREATE INDEX ix_responses_user_survey ON responses ("userID", "surveyID")')
+    #getSurveyToCompleteForUser and getSurveysToCompleteForUser
+    connection.exec_driver_sql('CREATE INDEX ix_user_progress_user_finished ON user_progress ("userID", survey_finished, "surveyID")')
+    #getUser(token=...)
+    connection.exec_driver_sql('CREATE INDEX ix_users_token ON users (token)')
+    #refresh planner statistics for the new indexes
+    connection.exec_driver_sql("ANALYZE")
+
+
+@migration(3, "unique submission key on responses")
+def addSubmissionKey(connection):
+    #keep the first copy of any option that was stored more than once
+    connection.exec_driver_sql("""
+        DELETE FROM responses WHERE "responseID" NOT IN (
+            SELECT MIN("responseID") FROM responses
+            GROUP BY "surveyID", "userID", "questionID", response)""")
+    connection.exec_driver_sql('CREATE UNIQUE INDEX ux_responses_submission ON responses ("surveyID", "userID", "questionID", response)')
+
+
+@migration(4, "answer options table")
+def addAnswerOptions(connection):
+    connection.exec_driver_sql("""
+        CREATE TABLE answer_options (
+            "optionID" INTEGER NOT NULL,
+            "questionID" INTEGER NOT NULL,
+            ordinal INTEGER NOT NULL,
+            text VARCHAR NOT NULL,
+            weight INTEGER,
+            scored BOOLEAN,
+            PRIMARY KEY ("optionID"),
+            FOREIGN KEY("questionID") REFERENCES questions ("questionID")
+        )""")
+    connection.exec_driver_sql('CREATE UNIQUE INDEX ux_answer_options_question_ordinal ON answer_options ("questionID", ordinal)')
+    connection.exec_driver_sql('CREATE UNIQUE INDEX ux_answer_options_question_text ON answer_options ("questionID", text)')
+
+    rows = []
+    for questionID, answer_text, answer_weights in connection.exec_driver_sql("""
+            SELECT q."questionID", a.answer, q.answer_weights
+            FROM questions q JOIN answers a ON a."answerID" = q."answerID"
+            """).all():
+        rows += answerOptionRows(questionID, answer_text, answer_weights)
+    if(rows != []):
+        connection.exec_driver_sql("""
+            INSERT INTO answer_options ("questionID", ordinal, text, weight, scored)
+            VALUES (:questionID, :ordinal, :text, :weight, :scored)""", rows)
+
+
+@migration(5, "one survey_answers row per question with a bitmask of chosen options")
+def addSurveyAnswers(connection):
+    connection.exec_driver_sql("""
+        CREATE TABLE survey_answers (
+            "surveyAnswerID" INTEGER NOT NULL,
+            "surveyID" INTEGER NOT NULL,
+            "userID" VARCHAR NOT NULL,
+            "questionID" INTEGER NOT NULL,
+            choices INTEGER NOT NULL,
+            PRIMARY KEY ("surveyAnswerID"),
+            FOREIGN KEY("surveyID") REFERENCES surveys ("surveyID"),
+            FOREIGN KEY("userID") REFERENCES users ("userID"),
+            FOREIGN KEY("questionID") REFERENCES questions ("questionID")
+        )""")
+
+    #responses that don't match an option of their question can't be encoded
+    #they are kept as they were in unmatched_responses, nothing reads that table
+    connection.exec_driver_sql("""
+        CREATE TABLE unmatched_responses AS
+        SELECT r.* FROM responses r
+        LEFT JOIN answer_options ao ON ao."questionID" = r."questionID" AND ao.text = r.response
+        WHERE ao."optionID" IS NULL""")
+    unmatched = connection.exec_driver_sql("SELECT COUNT(*) FROM unmatched_responses").scalar()
+
+    #one bit per chosen option, in the order the submissions were stored
+    connection.exec_driver_sql("""
+        INSERT INTO survey_answers ("surveyID", "userID", "questionID", choices)
+        SELECT r."surveyID", r."userID", r."questionID", SUM(1 << ao.ordinal)
+        FROM responses r
+        JOIN answer_options ao ON ao."questionID" = r."questionID" AND ao.text = r.response
+        GROUP BY r."surveyID", r."userID", r."questionID"
+        ORDER BY MIN(r."responseID")""")
+    connection.exec_driver_sql("DROP TABLE responses")
+    connection.exec_driver_sql(RESPONSES_VIEW)
+
+    connection.exec_driver_sql('CREATE UNIQUE INDEX ux_survey_answers_submission ON survey_answers ("surveyID", "userID", "questionID")')
+    connection.exec_driver_sql('CREATE INDEX ix_survey_answers_survey_question ON survey_answers ("surveyID", "questionID")')
+    connection.exec_driver_sql("ANALYZE")
+
+    if(unmatched == 0):
+        connection.exec_driver_sql("DROP TABLE unmatched_responses")
+        return None
+    return (f"{unmatched} stored answer(s) didn't match an answer option of their question and are left out of "
+            "the results. They were moved to the unmatched_responses table of the database.")
+
+
+@migration(6, "data versions and score cache")
+def addScoreCache(connection):
+    connection.exec_driver_sql("""
+        CREATE TABLE data_versions (
+            scope VARCHAR NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (scope)
+        )""")
+    connection.exec_driver_sql("""
+        CREATE TABLE score_cache (
+            "surveyID" INTEGER NOT NULL,
+            kind VARCHAR NOT NULL,
+            stamp VARCHAR NOT NULL,
+            payload VARCHAR NOT NULL,
+            PRIMARY KEY ("surveyID", kind),
+            FOREIGN KEY("surveyID") REFERENCES surveys ("surveyID")
+        )""")
+    for trigger in answerVersionTriggers() + scoringVersionTriggers(["answer_options", "questions", "categories"]):
+        connection.exec_driver_sql(trigger)
+
+
+@migration(7, "rating formulas")
+def addRatingFormulas(connection):
+    connection.exec_driver_sql("""
+        CREATE TABLE rating_formulas (
+            "ratingID" VARCHAR(10) NOT NULL,
+            name VARCHAR NOT NULL,
+            formula VARCHAR NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY ("ratingID")
+        )""")
+    defaultRatings = DefaultRatings()
+    for position, ratingID in enumerate(defaultRatings.ratingID):
+        connection.exec_driver_sql(
+            'INSERT INTO rating_formulas ("ratingID", name, formula, position) VALUES (?, ?, ?, ?)',
+            (ratingID, defaultRatings.name[position], defaultRatings.formula[position], position))
+    #formula edits change the scoring version like weight edits do
+    for trigger in scoringVersionTriggers(["rating_formulas"]):
+        connection.exec_driver_sql(trigger)
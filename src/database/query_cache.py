@@ -0,0 +1,143 @@
+from collections import OrderedDict
+import functools
+import threading
+import time
+
+from database.write_tracking import TableWriteTracker
+
+#size-bounded LRU of DatabaseManager read results for one database
+#entries are tagged with the tables they read and dropped when one of those tables is written
+#max_age bounds how long writes made by other processes on a shared file can go unnoticed
+class QueryCache:
+
+    _caches = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, max_entries=256, max_age=10.0):
+        self.max_entries = int(max_entries)
+        self.max_age = float(max_age)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        #bumped on every invalidation so results read before a write are never stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        #data_versions rows seen by the last syncDataVersions, None before the first one
+        self._data_versions = None
+
+    #cache for the database, created on first use with the config.json settings
+    #settings is True or an object with max_entries and/or max_age, anything else disables caching
+    @classmethod
+    def forDatabase(cls, db_url, settings):
+        if(settings is True):
+            settings = {}
+        if(not isinstance(settings, dict)):
+            return None
+        with cls._registry_lock:
+            cache = cls._caches.get(db_url)
+            if(cache is None):
+                cache = QueryCache(**settings)
+                cls._caches[db_url] = cache
+            return cache
+
+    @classmethod
+    def onTablesWritten(cls, db_url, table_names):
+        with cls._registry_lock:
+            cache = cls._caches.get(db_url)
+        if(cache is not None):
+            cache.invalidateTables(table_names)
+
+    #returns (True, value) on a hit and (False, generation) on a miss
+    #the generation has to be passed back to store
+    def lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if(entry is not None):
+                value, tables, stored_at = entry
+                if(time.monotonic() - stored_at <= self.max_age):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+            self.misses += 1
+            return False, self._generation
+
+    def store(self, key, value, tables, generation):
+        with self._lock:
+            if(generation != self._generation):
+                return
+            self._entries[key] = (value, frozenset(tables), time.monotonic())
+            self._entries.move_to_end(key)
+            while(len(self._entries) > self.max_entries):
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidateTables(self, table_names):
+        with self._lock:
+            self._generation += 1
+            stale = [key for key, entry in self._entries.items() if entry[1] & table_names]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    #writes by other connections don't reach onTablesWritten, they are noticed through data_versions
+    #versions is its current {scope: version}, scope_tables maps a scope to the tables it covers
+    #the first call clears everything as nothing is known about the cached results
+    def syncDataVersions(self, versions, scope_tables):
+        with self._lock:
+            previous = self._data_versions
+            self._data_versions = dict(versions)
+        if(previous is None):
+            self.clear()
+            return
+        tables = set()
+        for scope in set(previous) | set(versions):
+            if(previous.get(scope) != versions.get(scope)):
+                tables.update(scope_tables(scope))
+        if(tables):
+            self.invalidateTables(tables)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "invalidations": self.invalidations}
+
+
+#decorator for DatabaseManager read methods, tables lists every table the query reads
+#results are keyed by method name and arguments, list results are copied on the way out
+#so callers can't change the cached value
+def memoized(*tables):
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            cache = self.query_cache
+            if(cache is None):
+                return method(self, *args, **kwargs)
+
+            key = (method.__name__, args, tuple(sorted(kwargs.items())))
+            try:
+                hit, value = cache.lookup(key)
+            except TypeError:
+                #unhashable arguments are never cached
+                return method(self, *args, **kwargs)
+
+            if(not hit):
+                generation = value
+                value = method(self, *args, **kwargs)
+                cache.store(key, value, tables, generation)
+
+            if(isinstance(value, list)):
+                return list(value)
+            return value
+        return wrapper
+    return decorate
+
+
+TableWriteTracker.subscribe(QueryCache.onTablesWritten)
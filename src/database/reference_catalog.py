@@ -0,0 +1,176 @@
+import threading
+
+from database.write_tracking import TableWriteTracker
+from database.migrations import checklistPolarity
+
+#tables whose content is held by the catalog
+REFERENCE_TABLES = {"roles", "categories", "answers", "questions", "answer_options", "rating_formulas",
+                    "question_role_association", "role-specific-question-wordings"}
+
+#in-memory, indexed copy of the reference data (roles, categories, answers, questions, answer options, ratings)
+#loaded once per database and dropped only when one of the reference tables is written
+#the objects are detached from their session and shared between callers, treat them as read only
+class ReferenceCatalog:
+
+    _catalogs = {}
+    #bumped on every invalidation so a catalog loaded during a write is never stored
+    _generations = {}
+    _lock = threading.Lock()
+
+    #scoring_version is the "scoring" data version read before the tables, see dropIfStale
+    def __init__(self, roles, categories, answers, questions, associations, options, rating_formulas,
+                 scoring_version=0):
+        self.scoring_version = scoring_version
+        self.roles = list(roles)
+        self.rating_formulas = sorted(rating_formulas, key=lambda rating: rating.position)
+        self.categories = list(categories)
+        self.answers = list(answers)
+        self.questions = sorted(questions, key=lambda question: question.questionID)
+
+        self.roles_by_id = {role.roleID: role for role in self.roles}
+        self.categories_by_id = {category.categoryID: category for category in self.categories}
+        self.categories_by_name = {category.name: category for category in self.categories}
+        self.answers_by_id = {answer.answerID: answer for answer in self.answers}
+        self.questions_by_id = {question.questionID: question for question in self.questions}
+        self.questions_by_text = {question.text: question for question in self.questions}
+
+        #options per question in ordinal order, and by (questionID, text) to resolve stored responses
+        self.options_by_question = {}
+        self.options_by_text = {}
+        for option in sorted(options, key=lambda option: (option.questionID, option.ordinal)):
+            self.options_by_question.setdefault(option.questionID, []).append(option)
+            self.options_by_text[(option.questionID, option.text)] = option
+        self.checklist_polarity = {questionID: checklistPolarity((option.weight, option.scored) for option in options)
+                                   for questionID, options in self.options_by_question.items()}
+
+        #every list below keeps the questionID order
+        self.questions_by_category = {}
+        for question in self.questions:
+            self.questions_by_category.setdefault(question.categoryID, []).append(question)
+
+        question_roles = {}
+        for association in associations:
+            question_roles.setdefault(association.questionID, set()).add(association.roleID)
+
+        self.questions_by_role = {}
+        self.questions_by_role_and_category = {}
+        for question in self.questions:
+            for roleID in question_roles.get(question.questionID, ()):
+                self.questions_by_role.setdefault(roleID, []).append(question)
+                self.questions_by_role_and_category.setdefault((roleID, question.categoryID), []).append(question)
+
+    #lookups, lists are copies so callers can't change the catalog
+
+    def getRoles(self):
+        return list(self.roles)
+
+    def getRole(self, roleID):
+        return self.roles_by_id.get(roleID)
+
+    def getCategories(self):
+        return list(self.categories)
+
+    def getCategory(self, categoryID=None, name=None):
+        if(categoryID is not None):
+            return self.categories_by_id.get(categoryID)
+        return self.categories_by_name.get(name)
+
+    def getAnswers(self):
+        return list(self.answers)
+
+    #in display order
+    def getRatingFormulas(self):
+        return list(self.rating_formulas)
+
+    def getAnswer(self, answerID):
+        return self.answers_by_id.get(answerID)
+
+    def getQuestions(self):
+        return list(self.questions)
+
+    def getQuestion(self, questionID=None, text=None):
+        if(questionID is not None):
+            return self.questions_by_id.get(questionID)
+        return self.questions_by_text.get(text)
+
+    def getQuestionsByCategory(self, categoryID):
+        return list(self.questions_by_category.get(categoryID, []))
+
+    def getQuestionsForRole(self, roleID):
+        return list(self.questions_by_role.get(roleID, []))
+
+    def getQuestionsForRoleByCategory(self, roleID, categoryID):
+        return list(self.questions_by_role_and_category.get((roleID, categoryID), []))
+
+    def getAnswerOptions(self, questionID):
+        return list(self.options_by_question.get(questionID, []))
+
+    def getAnswerOption(self, questionID, text=None, ordinal=None):
+        if(ordinal is not None):
+            options = self.options_by_question.get(questionID, [])
+            return options[ordinal] if 0 <= ordinal < len(options) else None
+        return self.options_by_text.get((questionID, text))
+
+    #+1 or -1 for checklist questions, 0 otherwise, see checklistPolarity
+    def getChecklistPolarity(self, questionID):
+        return self.checklist_polarity.get(questionID, 0)
+
+    #checklist questions can be answered with no option ticked
+    def isChecklist(self, questionID):
+        return self.getChecklistPolarity(questionID) != 0
+
+    #bitmask of the chosen options of a question, bit n set means the option with ordinal n was chosen
+    def encodeChoices(self, questionID, texts):
+        choices = 0
+        for text in texts:
+            option = self.options_by_text.get((questionID, text))
+            if(option is None):
+                raise ValueError(f"'{text}' is not an answer option of question {questionID}")
+            choices |= 1 << option.ordinal
+        return choices
+
+    #per-database registry
+
+    @classmethod
+    def get(cls, db_url):
+        with cls._lock:
+            return cls._catalogs.get(db_url)
+
+    @classmethod
+    def generation(cls, db_url):
+        with cls._lock:
+            return cls._generations.setdefault(db_url, 0)
+
+    #keep a freshly loaded catalog unless the reference tables changed while it was loading
+    @classmethod
+    def store(cls, db_url, catalog, generation):
+        with cls._lock:
+            if(cls._generations.get(db_url, 0) == generation):
+                cls._catalogs[db_url] = catalog
+
+    @classmethod
+    def invalidate(cls, db_url=None):
+        with cls._lock:
+            if(db_url is None):
+                for url in list(cls._generations):
+                    cls._generations[url] += 1
+                cls._catalogs.clear()
+            else:
+                cls._generations[db_url] = cls._generations.get(db_url, 0) + 1
+                cls._catalogs.pop(db_url, None)
+
+    #writes by other connections don't reach onTablesWritten, they are noticed through the
+    #"scoring" data version the triggers bump, scoring_version is its current value
+    @classmethod
+    def dropIfStale(cls, db_url, scoring_version):
+        catalog = cls.get(db_url)
+        if(catalog is not None and catalog.scoring_version != scoring_version):
+            cls.invalidate(db_url)
+
+    @classmethod
+    def onTablesWritten(cls, db_url, table_names):
+        if(table_names & REFERENCE_TABLES):
+            cls.invalidate(db_url)
+
+
+TableWriteTracker.subscribe(ReferenceCatalog.onTablesWritten)
@@ -0,0 +1,71 @@
+from sqlalchemy.orm import Session
+import traceback
+import threading
+import weakref
+import atexit
+
+#debug helper reporting sessions that were never closed and where they were opened
+#disabled by default, see "session_leak_detection" in config.json
+class SessionLeakDetector:
+
+    enabled = False
+    _open_sessions = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def enable(cls):
+        if(cls.enabled):
+            return
+        cls.enabled = True
+        atexit.register(cls.report)
+
+    @classmethod
+    def track(cls, session):
+        #skip the frames of the session machinery itself
+        call_site = traceback.format_list(traceback.extract_stack()[:-3])
+        key = id(session)
+        with cls._lock:
+            cls._open_sessions[key] = call_site
+        #a session garbage collected before close() has leaked its connection until now
+        weakref.finalize(session, cls._collected, key)
+
+    @classmethod
+    def untrack(cls, session):
+        with cls._lock:
+            cls._open_sessions.pop(id(session), None)
+
+    @classmethod
+    def _collected(cls, key):
+        with cls._lock:
+            call_site = cls._open_sessions.pop(key, None)
+        if(call_site is not None):
+            print("Session garbage collected without being closed, opened at:\n" + "".join(call_site))
+
+    #sessions opened and not yet closed, with the call stack that opened each of them
+    @classmethod
+    def openSessions(cls):
+        with cls._lock:
+            return list(cls._open_sessions.values())
+
+    @classmethod
+    def report(cls):
+        open_sessions = cls.openSessions()
+        if(open_sessions == []):
+            return
+        print(f"{len(open_sessions)} database session(s) left open:")
+        for call_site in open_sessions:
+            print("".join(call_site))
+
+
+#session class used by every DatabaseManager session factory
+class TrackedSession(Session):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if(SessionLeakDetector.enabled):
+            SessionLeakDetector.track(self)
+
+    def close(self):
+        if(SessionLeakDetector.enabled):
+            SessionLeakDetector.untrack(self)
+        super().close()
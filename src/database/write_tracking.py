@@ -0,0 +1,61 @@
+from sqlalchemy import event, inspect
+import threading
+
+#collects the tables written in a session transaction and announces them once it commits
+#used to invalidate in-memory copies of database content
+class TableWriteTracker:
+
+    _listeners = []
+    _lock = threading.Lock()
+
+    #callback(db_url, table_names) is called after every commit that wrote to at least one table
+    @classmethod
+    def subscribe(cls, callback):
+        with cls._lock:
+            cls._listeners.append(callback)
+
+    #announce writes made outside of a tracked session (e.g. migrations)
+    @classmethod
+    def announce(cls, db_url, table_names):
+        with cls._lock:
+            listeners = list(cls._listeners)
+        for callback in listeners:
+            callback(db_url, set(table_names))
+
+    @classmethod
+    def install(cls, session_factory, db_url):
+        event.listen(session_factory, "after_flush", cls._afterFlush)
+        event.listen(session_factory, "do_orm_execute", cls._onExecute)
+        event.listen(session_factory, "after_commit", lambda session: cls._afterCommit(session, db_url))
+        event.listen(session_factory, "after_rollback", cls._afterRollback)
+
+    @staticmethod
+    def _written(session):
+        return session.info.setdefault("written_tables", set())
+
+    #objects added, changed or deleted through the unit of work
+    @classmethod
+    def _afterFlush(cls, session, flush_context):
+        written = cls._written(session)
+        for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+            for table in inspect(instance).mapper.tables:
+                written.add(table.name)
+
+    #insert/update/delete statements run through session.execute or query.update/delete
+    @classmethod
+    def _onExecute(cls, orm_execute_state):
+        if(orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+            table = getattr(orm_execute_state.statement, "table", None)
+            name = getattr(table, "name", None)
+            if(name is not None):
+                cls._written(session=orm_execute_state.session).add(name)
+
+    @classmethod
+    def _afterCommit(cls, session, db_url):
+        written = session.info.pop("written_tables", set())
+        if(written != set()):
+            cls.announce(db_url, written)
+
+    @classmethod
+    def _afterRollback(cls, session):
+        session.info.pop("written_tables", None)
@@ -1,12 +1,16 @@
 #external library imports
 import sys
 import os
+import atexit
+import multiprocessing
 from sqlalchemy.exc import OperationalError
 
 #local imports
 from database.main_database import DatabaseManager
+from database.migrations import MigrationError
+from database.session_tracking import SessionLeakDetector
 from constants import ConstantsAndUtilities
-from ui_logic.new_setup import NewSetupWindow, DashboardWindow
+from ui_logic.new_setup import NewSetupWindow, DashboardWindow, showMigrationError, showMigrationNotices
 from ui_logic.login import LoginWindow
 
 #ui imports
@@ -35,6 +39,9 @@ def setPath():
 #app starting point
 if __name__ == '__main__':
 
+    #needed by the frozen executable, bootstrap intervals of large surveys run on worker processes
+    multiprocessing.freeze_support()
+
     #set the path to the directory of the executable/.py file
     setPath()
         
@@ -49,6 +56,10 @@ if __name__ == '__main__':
     
     constants = ConstantsAndUtilities()
 
+    #debug mode, report database sessions that are never closed
+    if(constants.getSessionLeakDetection()):
+        SessionLeakDetector.enable()
+
     #if there is no registered database path, wrong path, or no users
     #are found assume a new installation
     #and initialise new setup
@@ -57,11 +68,18 @@ if __name__ == '__main__':
 
     #check for a wrong path
     try:
-        user = DatabaseManager().getUser()
+        manager = DatabaseManager()
+        #bring databases created by older versions up to the current schema
+        showMigrationNotices(manager.migrateDatabase())
+        user = manager.getUser()
         if(user == []):
             window = NewSetupWindow()
     except OperationalError:
         window = NewSetupWindow()
+    #the database is left as it was, the app can't run on a half upgraded schema
+    except MigrationError as error:
+        showMigrationError(error)
+        sys.exit(1)
 
     #if not a new install check for session token and if found
     #log in right away
@@ -75,5 +93,9 @@ if __name__ == '__main__':
             manager.openSessionToken(user.userID)
             window = DashboardWindow()
 
+    #lets the operator tune the connection profile, see "contention_log" in README.md
+    if(constants.getContentionLog() and constants.getDatabasePath() != ""):
+        atexit.register(DatabaseManager().logContentionStats)
+
     window.show()
     app.exec()
\ No newline at end of file
@@ -0,0 +1,21 @@
+#print the category scores of every survey as CSV, computed with the vectorized scoring engine
+#all surveys are scored from a single load of the answers, ordered by date
+#uses weighted scoring when config.json has "scoring_mode": "weighted"
+#for batch and offline use, run from the folder that holds config.json
+
+import sys
+
+from database.main_database import DatabaseManager
+from scoring.engine import ScoringEngine
+from constants import ConstantsAndUtilities
+
+manager = DatabaseManager()
+#stdout is the output, upgrade notices go to stderr
+for notice in manager.migrateDatabase():
+    print(notice, file=sys.stderr)
+engine = ScoringEngine.fromDatabase(manager, ConstantsAndUtilities().isWeightedScoring())
+history = engine.scoreHistory(manager)
+
+print(",".join(["surveyID", "date"] + [category.categoryID for category in history.categories]))
+for survey, scores in zip(history.surveys, history.scores):
+    print(",".join([str(survey.surveyID), str(survey.date)] + [str(float(score)) for score in scores]))
@@ -0,0 +1,69 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+
+import numpy as np
+
+#bootstrap confidence intervals of the category scores, ratings and overall score of a survey
+#respondents are resampled with replacement, a resample is the number of times every respondent is drawn
+#(one multinomial draw), so the category sums and counts of all resamples are matrix products of the draws
+#with the per respondent totals of ScoringEngine.userTotals
+#resamples are computed in chunks that bound the size of the draw matrix, big surveys spread them over processes
+
+RESAMPLES = 2000
+CONFIDENCE = 0.95
+SEED = 0
+#draw matrix entries per chunk
+CHUNK_ENTRIES = 4000000
+#respondents x resamples from which the chunks run in a process pool
+PARALLEL_THRESHOLD = 20000000
+
+#(resamples x categories) unrounded category scores of one chunk, runs in the worker processes
+def resampleScores(user_sums, user_counts, resamples, seed):
+    generator = np.random.default_rng(seed)
+    num_users = user_sums.shape[0]
+    draws = generator.multinomial(num_users, np.full(num_users, 1 / num_users), size=resamples)
+    sums = draws @ user_sums
+    counts = draws @ user_counts
+    scores = np.zeros(sums.shape)
+    np.divide(sums, counts, out=scores, where=counts > 0)
+    return scores
+
+#(resamples x categories) category scores of all resamples
+def bootstrapScores(user_sums, user_counts, resamples=RESAMPLES, seed=SEED):
+    num_users = user_sums.shape[0]
+    if(num_users == 0):
+        return np.zeros((resamples, user_sums.shape[1]))
+
+    chunk_size = max(1, CHUNK_ENTRIES // num_users)
+    chunks = [min(chunk_size, resamples - start) for start in range(0, resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+
+    if(num_users * resamples < PARALLEL_THRESHOLD or len(chunks) == 1):
+        results = [resampleScores(user_sums, user_counts, size, chunk_seed) for size, chunk_seed in zip(chunks, seeds)]
+    else:
+        #spawn, forking a process that runs Qt and worker threads isn't safe
+        with ProcessPoolExecutor(max_workers=min(len(chunks), os.cpu_count() or 1),
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            results = list(executor.map(resampleScores, [user_sums] * len(chunks), [user_counts] * len(chunks),
+                                        chunks, seeds))
+    return np.concatenate(results)
+
+#lower and upper bounds as {"categories": {categoryID: [low, high]}, "ratings": {ratingID: [low, high]},
+#"overall": [low, high]}, formulas are the RatingFormulas used for the ratings
+def scoreIntervals(engine, responses, formulas, resamples=RESAMPLES, confidence=CONFIDENCE):
+    scores = bootstrapScores(*engine.userTotals(responses), resamples)
+    ratings = formulas.evaluate(scores)
+    overall_scores = formulas.overall(ratings)
+
+    quantiles = [(1 - confidence) / 2, 1 - (1 - confidence) / 2]
+    category_bounds = np.quantile(scores, quantiles, axis=0)
+    rating_bounds = np.quantile(ratings, quantiles, axis=0) if ratings.shape[1] > 0 else np.zeros((2, 0))
+    overall_bounds = np.quantile(overall_scores, quantiles)
+    return {
+        "categories": {category.categoryID: [float(category_bounds[0, index]), float(category_bounds[1, index])]
+                       for index, category in enumerate(engine.categories)},
+        "ratings": {ratingID: [float(rating_bounds[0, index]), float(rating_bounds[1, index])]
+                    for index, ratingID in enumerate(formulas.ratingIDs)},
+        "overall": [float(overall_bounds[0]), float(overall_bounds[1])]
+    }
@@ -0,0 +1,311 @@
+import numpy as np
+
+from database.migrations import answerOptionRows, checklistPolarity
+from scoring.ratings import RatingFormulas
+
+#vectorized scoring of survey answers for batch and offline use
+#responses are held as integer arrays (survey index, question index, option index, user index) and scored
+#through (questions x options) lookup tables, counts are built with np.bincount
+#
+#standard scoring gives exactly the scores of ThreadedScoreCalculator, checklist options and options weighted 0
+#(answer_options.scored False) are left out
+#weighted scoring (opt-in) multiplies every answer by its Question.weight (0 leaves the question out) and gives
+#each answer to a checklist question a score from 1 to 5 by the share of options ticked,
+#1 + 4*ticked/options for "+1" checklists and 5 - 4*ticked/options for "-1" checklists
+#both are the same pass over WeightTables
+class ScoringEngine:
+
+    def __init__(self, catalog, weighted=False):
+        self.weighted = weighted
+        self.questions = catalog.getQuestions()
+        self.categories = catalog.getCategories()
+        self.question_index = {question.questionID: index for index, question in enumerate(self.questions)}
+        self.category_index = {category.categoryID: index for index, category in enumerate(self.categories)}
+        self.num_questions = len(self.questions)
+        self.num_categories = len(self.categories)
+        self.num_options = max([len(catalog.getAnswerOptions(question.questionID)) for question in self.questions] + [1])
+
+        #stored weights indexed by [question index, option ordinal]
+        self.weights = np.zeros((self.num_questions, self.num_options), dtype=np.int64)
+        self.scored = np.zeros((self.num_questions, self.num_options), dtype=bool)
+        self.option_texts = []
+        for question_index, question in enumerate(self.questions):
+            options = catalog.getAnswerOptions(question.questionID)
+            self.option_texts.append([option.text for option in options])
+            for option in options:
+                if(option.weight is not None):
+                    self.weights[question_index, option.ordinal] = option.weight
+                self.scored[question_index, option.ordinal] = bool(option.scored)
+        #+1 or -1 for checklist questions, 0 otherwise
+        self.polarity = np.array([catalog.getChecklistPolarity(question.questionID) for question in self.questions],
+                                 dtype=np.int64)
+        self.stored_question_weights = np.array([1 if question.weight is None else question.weight
+                                                 for question in self.questions], dtype=np.int64)
+
+        self.tables = self.weightTables()
+
+        #(questions x categories) membership matrix
+        self.question_category = np.array([self.category_index[question.categoryID] for question in self.questions],
+                                          dtype=np.int64)
+        self.membership = np.zeros((self.num_questions, self.num_categories), dtype=np.int64)
+        self.membership[np.arange(self.num_questions), self.question_category] = 1
+
+    @classmethod
+    def fromDatabase(cls, manager, weighted=False):
+        return cls(manager.getCatalog(), weighted)
+
+    #lookup tables of the scoring model, answer_weights ({questionID: "5,4,3,2,1"} in the format of
+    #Question.answer_weights) and question_weights ({questionID: weight}) replace the stored weights of those questions
+    def weightTables(self, answer_weights=None, question_weights=None):
+        weights = self.weights.copy()
+        scored = self.scored.copy()
+        polarity = self.polarity.copy()
+        for questionID, text in (answer_weights or {}).items():
+            index = self.questionIndex(questionID)
+            #one weight per option, a checklist's "+1" or "-1" applies to all of them
+            num_options = len(self.option_texts[index])
+            if(text not in ("+1", "-1") and len(text.split(',')) != num_options):
+                raise ValueError(f"Question {questionID} has {num_options} answer options, "
+                                 f"\"{text}\" gives {len(text.split(','))} weights")
+            weights[index] = 0
+            scored[index] = False
+            rows = answerOptionRows(questionID, ';'.join(self.option_texts[index]), text)
+            for row in rows:
+                weights[index, row["ordinal"]] = row["weight"] or 0
+                scored[index, row["ordinal"]] = row["scored"]
+            polarity[index] = checklistPolarity((row["weight"], row["scored"]) for row in rows)
+
+        #standard scoring stays in integers so the rounding matches the reference
+        tables = WeightTables(weights * scored, scored.astype(np.int64), np.zeros(self.num_questions, dtype=np.int64),
+                              np.zeros(self.num_questions, dtype=np.int64), np.ones(self.num_questions, dtype=np.int64))
+        if(not self.weighted):
+            if(question_weights):
+                raise ValueError("Question weights only apply to weighted scoring")
+            return tables
+
+        tables.option_values = tables.option_values.astype(float)
+        tables.answer_values = tables.answer_values.astype(float)
+        tables.question_weights = self.stored_question_weights.copy()
+        for questionID, weight in (question_weights or {}).items():
+            tables.question_weights[self.questionIndex(questionID)] = weight
+        for index in np.nonzero(polarity)[0]:
+            num_options = len(self.option_texts[index])
+            tables.option_values[index, :num_options] = polarity[index] * 4 / num_options
+            tables.answer_values[index] = 1 if polarity[index] == 1 else 5
+            tables.answer_counted[index] = 1
+        return tables
+
+    def questionIndex(self, questionID):
+        if(questionID not in self.question_index):
+            raise ValueError(f"Unknown question {questionID}")
+        return self.question_index[questionID]
+
+    #expand survey_answers rows (surveyID, userID, questionID, choices bitmask) into one entry per chosen option
+    #surveyIDs fixes the survey axis, by default the surveys found in rows in ascending order
+    def encodeResponses(self, rows, surveyIDs=None):
+        if(surveyIDs is None):
+            surveyIDs = sorted(set(row[0] for row in rows))
+        survey_index = {surveyID: index for index, surveyID in enumerate(surveyIDs)}
+        userIDs = sorted(set(row[1] for row in rows))
+        user_index = {userID: index for index, userID in enumerate(userIDs)}
+
+        rows = [row for row in rows if row[0] in survey_index and row[2] in self.question_index]
+        row_surveys = np.array([survey_index[row[0]] for row in rows], dtype=np.int64)
+        row_users = np.array([user_index[row[1]] for row in rows], dtype=np.int64)
+        row_questions = np.array([self.question_index[row[2]] for row in rows], dtype=np.int64)
+        row_choices = np.array([row[3] for row in rows], dtype=np.int64)
+
+        #bit n of a row's choices set means option n was chosen
+        chosen = ((row_choices[:, None] >> np.arange(self.num_options, dtype=np.int64)) & 1).astype(bool)
+        row_numbers, option_numbers = np.nonzero(chosen)
+        #every row is an answer, including checklists answered with nothing ticked (choices 0)
+        return SurveyResponses(row_questions[row_numbers], option_numbers.astype(np.int64), row_users[row_numbers],
+                               userIDs, row_surveys[row_numbers], surveyIDs,
+                               row_questions, row_surveys, row_users)
+
+    def loadResponses(self, manager, surveyID):
+        return self.encodeResponses(manager.getSurveyAnswers(surveyID), [surveyID])
+
+    #number of times each option was chosen as a (questions x options) matrix
+    #with per_survey a (surveys x questions x options) array
+    def optionCounts(self, responses, per_survey=False):
+        cells = responses.question_index * self.num_options + responses.option_index
+        if(not per_survey):
+            return np.bincount(cells, minlength=self.num_questions * self.num_options).reshape(
+                self.num_questions, self.num_options)
+
+        cells = cells + responses.survey_index * (self.num_questions * self.num_options)
+        num_surveys = len(responses.surveyIDs)
+        return np.bincount(cells, minlength=num_surveys * self.num_questions * self.num_options).reshape(
+            num_surveys, self.num_questions, self.num_options)
+
+    #number of answers (stored rows, a checklist may have nothing ticked) per question, shaped like optionCounts without options
+    def answerCounts(self, responses, per_survey=False):
+        if(not per_survey):
+            return np.bincount(responses.answer_question_index, minlength=self.num_questions)
+
+        cells = responses.answer_survey_index * self.num_questions + responses.answer_question_index
+        num_surveys = len(responses.surveyIDs)
+        return np.bincount(cells, minlength=num_surveys * self.num_questions).reshape(num_surveys, self.num_questions)
+
+    #per question sum of the answer scores and number of scored answers, before the question weights
+    #counts is (questions x options) or has extra leading axes, e.g. (surveys x questions x options),
+    #answers is the matching answerCounts and only needed for weighted scoring
+    #tables defaults to the stored weights, stacked tables (WeightTables.stack) add their axis in front
+    def questionTotals(self, counts, answers=None, tables=None):
+        if(tables is None):
+            tables = self.tables
+        question_sums = (counts * tables.option_values).sum(axis=-1)
+        question_counts = (counts * tables.option_counted).sum(axis=-1)
+        if(answers is not None):
+            question_sums = question_sums + answers * tables.answer_values
+            question_counts = question_counts + answers * tables.answer_counted
+        return question_sums, question_counts
+
+    #per category sum of the answer scores and number of scored answers, arguments as questionTotals
+    def categoryTotals(self, counts, answers=None, tables=None):
+        if(tables is None):
+            tables = self.tables
+        question_sums, question_counts = self.questionTotals(counts, answers, tables)
+        question_sums = question_sums * tables.question_weights
+        question_counts = question_counts * tables.question_weights
+        return question_sums @ self.membership, question_counts @ self.membership
+
+    def totals(self, responses, per_survey=False):
+        answers = self.answerCounts(responses, per_survey) if self.weighted else None
+        return self.categoryTotals(self.optionCounts(responses, per_survey), answers)
+
+    #(users x categories) sums and counts of every respondent's scored answers, question weights included
+    #rows follow responses.userIDs, adding up the rows gives categoryTotals
+    def userTotals(self, responses):
+        num_cells = len(responses.userIDs) * self.num_categories
+        questions, options = responses.question_index, responses.option_index
+        question_weights = self.tables.question_weights[questions]
+        cells = responses.user_index * self.num_categories + self.question_category[questions]
+        sums = np.bincount(cells, weights=self.tables.option_values[questions, options] * question_weights,
+                           minlength=num_cells)
+        counts = np.bincount(cells, weights=self.tables.option_counted[questions, options] * question_weights,
+                             minlength=num_cells)
+
+        if(self.weighted):
+            questions = responses.answer_question_index
+            question_weights = self.tables.question_weights[questions]
+            cells = responses.answer_user_index * self.num_categories + self.question_category[questions]
+            sums += np.bincount(cells, weights=self.tables.answer_values[questions] * question_weights,
+                                minlength=num_cells)
+            counts += np.bincount(cells, weights=self.tables.answer_counted[questions] * question_weights,
+                                  minlength=num_cells)
+        return sums.reshape(-1, self.num_categories), counts.reshape(-1, self.num_categories)
+
+    #category scores from sums and counts of any shape, the mean score rounded to 2 places
+    #and 0.0 without answers, divided and rounded in Python to match the reference exactly
+    def scoresFromTotals(self, sums, counts):
+        scores = np.zeros(sums.shape, dtype=float)
+        for index in np.ndindex(sums.shape):
+            score_sum, score_count = sums[index].item(), counts[index].item()
+            scores[index] = round(score_sum/score_count, 2) if score_count > 0 else 0.0
+        return scores
+
+    #{categoryID: score}
+    def categoryScores(self, responses):
+        scores = self.scoresFromTotals(*self.totals(responses))
+        return {category.categoryID: float(scores[index]) for index, category in enumerate(self.categories)}
+
+    #{categoryID: score} and the contribution of every question with scored answers, from the same totals
+    #a contribution holds the question's mean score, its number of scored answers
+    #and its share of the category's score sum (question weights included)
+    def categoryBreakdown(self, responses):
+        answers = self.answerCounts(responses) if self.weighted else None
+        question_sums, question_counts = self.questionTotals(self.optionCounts(responses), answers)
+        weighted_sums = question_sums * self.tables.question_weights
+        sums = weighted_sums @ self.membership
+        counts = (question_counts * self.tables.question_weights) @ self.membership
+        scores = self.scoresFromTotals(sums, counts)
+
+        contributions = []
+        for index in np.nonzero(question_counts)[0]:
+            question = self.questions[index]
+            category_sum = sums[self.question_category[index]].item()
+            contributions.append({
+                "questionID": question.questionID,
+                "text": question.text,
+                "categoryID": question.categoryID,
+                "mean": round(question_sums[index].item() / question_counts[index].item(), 2),
+                "count": question_counts[index].item(),
+                "share": weighted_sums[index].item() / category_sum if category_sum != 0 else 0.0
+            })
+        return ({category.categoryID: float(scores[index]) for index, category in enumerate(self.categories)},
+                contributions)
+
+    #(surveys x categories) score matrix of the given surveys from a single load of their answers
+    def scoreSurveys(self, manager, surveyIDs):
+        if(len(surveyIDs) == 1):
+            rows = manager.getSurveyAnswers(surveyIDs[0])
+        else:
+            rows = manager.getSurveyAnswers()
+        responses = self.encodeResponses(rows, surveyIDs)
+        return self.scoresFromTotals(*self.totals(responses, per_survey=True))
+
+    #category scores and ratings of every survey from a single load of all answers
+    def scoreHistory(self, manager):
+        surveys = surveysByDate(manager)
+        return ScoreHistory(surveys, self.categories, self.scoreSurveys(manager, [survey.surveyID for survey in surveys]),
+                            RatingFormulas.fromDatabase(manager))
+
+
+#scoring model as arrays: an answer adds option_values (questions x options) of the ticked options plus
+#answer_values (questions) to its category's sum, option_counted plus answer_counted to the count,
+#both times question_weights (questions)
+class WeightTables:
+    def __init__(self, option_values, option_counted, answer_values, answer_counted, question_weights):
+        self.option_values = option_values
+        self.option_counted = option_counted
+        self.answer_values = answer_values
+        self.answer_counted = answer_counted
+        self.question_weights = question_weights
+
+    #N tables as one with a leading weight set axis
+    @classmethod
+    def stack(cls, tables):
+        return cls(np.stack([table.option_values for table in tables]), np.stack([table.option_counted for table in tables]),
+                   np.stack([table.answer_values for table in tables]), np.stack([table.answer_counted for table in tables]),
+                   np.stack([table.question_weights for table in tables]))
+
+
+#chosen options, entry i is option option_index[i] of question question_index[i] chosen by user
+#userIDs[user_index[i]] in survey surveyIDs[survey_index[i]]
+#answer_question_index, answer_survey_index and answer_user_index hold one entry per answered question
+class SurveyResponses:
+    def __init__(self, question_index, option_index, user_index, userIDs, survey_index, surveyIDs,
+                 answer_question_index, answer_survey_index, answer_user_index):
+        self.question_index = question_index
+        self.option_index = option_index
+        self.user_index = user_index
+        self.userIDs = userIDs
+        self.survey_index = survey_index
+        self.surveyIDs = surveyIDs
+        self.answer_question_index = answer_question_index
+        self.answer_survey_index = answer_survey_index
+        self.answer_user_index = answer_user_index
+
+    def __len__(self):
+        return len(self.question_index)
+
+
+#scores of a list of surveys, e.g. all of them ordered by date
+#scores is a (surveys x categories) matrix in category order, ratings a (surveys x ratings) matrix
+#computed with formulas (RatingFormulas), rating_names labels its columns
+class ScoreHistory:
+    def __init__(self, surveys, categories, scores, formulas):
+        self.surveys = surveys
+        self.categories = categories
+        self.scores = scores
+        self.dates = [survey.date for survey in surveys]
+        self.ratingIDs = formulas.ratingIDs
+        self.rating_names = formulas.names
+        self.ratings = formulas.evaluate(scores)
+        self.overall_scores = formulas.overall(self.ratings)
+
+
+def surveysByDate(manager):
+    return sorted(manager.getSurvey(), key=lambda survey: (survey.date, survey.surveyID))
@@ -0,0 +1,66 @@
+import threading
+
+import numpy as np
+import numexpr
+from numexpr.necompiler import getExprNames
+
+#ratings (Need, Attitude, Awareness, ...) computed from category scores with the formulas in rating_formulas
+#every formula is a numexpr expression over category IDs, e.g. (TDU+IAB)/2
+#formulas are compiled once per catalog and evaluated over whole (... x categories) score arrays,
+#the overall score is the mean of the ratings
+class RatingFormulas:
+
+    #db url -> (catalog, RatingFormulas) of the catalog they were compiled for
+    _compiled = {}
+    _lock = threading.Lock()
+
+    #formulas are RatingFormula rows in display order, categoryIDs the order of the score columns
+    def __init__(self, formulas, categoryIDs):
+        self.ratingIDs = [formula.ratingID for formula in formulas]
+        self.names = [formula.name for formula in formulas]
+        self.formulas = [formula.formula for formula in formulas]
+        self.categoryIDs = list(categoryIDs)
+        category_columns = {categoryID: column for column, categoryID in enumerate(self.categoryIDs)}
+
+        #(compiled expression, score columns of its inputs) per rating
+        self.compiled = []
+        for formula in formulas:
+            try:
+                names = getExprNames(formula.formula, {})[0]
+            except SyntaxError as error:
+                raise ValueError(f"Invalid formula for rating {formula.ratingID}: {formula.formula}") from error
+            unknown = [name for name in names if name not in category_columns]
+            if(unknown != []):
+                raise ValueError(f"Unknown categories {unknown} in the formula for rating {formula.ratingID}")
+            expression = numexpr.NumExpr(formula.formula, signature=[(name, np.float64) for name in names])
+            self.compiled.append((expression, [category_columns[name] for name in names]))
+
+    #compiled formulas of the database's current catalog
+    @classmethod
+    def fromDatabase(cls, manager):
+        catalog = manager.getCatalog()
+        with cls._lock:
+            entry = cls._compiled.get(manager.db_url)
+        if(entry is not None and entry[0] is catalog):
+            return entry[1]
+
+        formulas = cls(catalog.getRatingFormulas(), [category.categoryID for category in catalog.getCategories()])
+        with cls._lock:
+            cls._compiled[manager.db_url] = (catalog, formulas)
+        return formulas
+
+    #scores is (... x categories) in categoryIDs order, returns (... x ratings)
+    def evaluate(self, scores):
+        scores = np.asarray(scores, dtype=np.float64)
+        shape = scores.shape[:-1]
+        ratings = np.zeros(shape + (len(self.compiled),))
+        for index, (expression, columns) in enumerate(self.compiled):
+            inputs = [np.ascontiguousarray(scores[..., column]) for column in columns]
+            ratings[..., index] = np.broadcast_to(expression(*inputs), shape)
+        return ratings
+
+    #overall score from the output of evaluate
+    def overall(self, ratings):
+        if(len(self.compiled) == 0):
+            return np.zeros(np.shape(ratings)[:-1])
+        return np.mean(ratings, axis=-1)
@@ -0,0 +1,85 @@
+import numpy as np
+
+from scoring.engine import ScoringEngine, ScoreHistory, surveysByDate
+from scoring.ratings import RatingFormulas
+from scoring import bootstrap
+
+#computed scores are kept per survey in the score_cache table and reused across views and restarts
+#an entry is only used while its stamp matches DatabaseManager.getDataStamps, which changes
+#when the survey's answers or the answer weights, questions, categories or rating formulas are written
+
+SCORES = "scores"
+WEIGHTED_SCORES = "weighted_scores"
+BREAKDOWN = "breakdown"
+WEIGHTED_BREAKDOWN = "weighted_breakdown"
+INTERVALS = "intervals"
+WEIGHTED_INTERVALS = "weighted_intervals"
+
+#results of several kinds for the surveys as {surveyID: {kind: result}}
+#compute(surveyIDs) is only called for the surveys missing an entry of any of the kinds
+#and returns {surveyID: {kind: result}}, so results computed together are also cached together
+def cachedKinds(manager, kinds, surveyIDs, compute):
+    stamps = manager.getDataStamps(surveyIDs)
+    cached = {kind: manager.getCachedResults(kind, stamps) for kind in kinds}
+    results = {surveyID: {kind: cached[kind][surveyID] for kind in kinds} for surveyID in surveyIDs
+               if all(surveyID in cached[kind] for kind in kinds)}
+    missing = [surveyID for surveyID in surveyIDs if surveyID not in results]
+    if(missing != []):
+        computed = compute(missing)
+        try:
+            for kind in kinds:
+                manager.storeCachedResults(kind, {surveyID: (stamps[surveyID], computed[surveyID][kind])
+                                                  for surveyID in missing})
+        except Exception as error:
+            #the results are still returned, they are computed again next time
+            print("Could not cache the " + ", ".join(kinds) + ": " + str(error))
+        results.update(computed)
+    return results
+
+#results of one kind as {surveyID: result}, compute(surveyIDs) returns {surveyID: result}
+def cachedResults(manager, kind, surveyIDs, compute):
+    def computeKind(surveyIDs):
+        return {surveyID: {kind: result} for surveyID, result in compute(surveyIDs).items()}
+    results = cachedKinds(manager, [kind], surveyIDs, computeKind)
+    return {surveyID: result[kind] for surveyID, result in results.items()}
+
+#{surveyID: {categoryID: score}} computed with the scoring engine
+def engineScores(manager, surveyIDs, weighted):
+    categories = manager.getCategories()
+    scores = ScoringEngine.fromDatabase(manager, weighted).scoreSurveys(manager, surveyIDs)
+    return {surveyID: {category.categoryID: float(score) for category, score in zip(categories, row)}
+            for surveyID, row in zip(surveyIDs, scores)}
+
+#{categoryID: score} of a survey, its per question contributions (ScoringEngine.categoryBreakdown)
+#and the bootstrap confidence intervals of its scores and ratings (bootstrap.scoreIntervals)
+#all three come from one load of the answers and are cached together
+def surveyResults(manager, surveyID, weighted=False):
+    if(weighted):
+        kinds = [WEIGHTED_SCORES, WEIGHTED_BREAKDOWN, WEIGHTED_INTERVALS]
+    else:
+        kinds = [SCORES, BREAKDOWN, INTERVALS]
+
+    def compute(surveyIDs):
+        engine = ScoringEngine.fromDatabase(manager, weighted)
+        formulas = RatingFormulas.fromDatabase(manager)
+        results = {}
+        for surveyID in surveyIDs:
+            responses = engine.loadResponses(manager, surveyID)
+            scores, contributions = engine.categoryBreakdown(responses)
+            results[surveyID] = dict(zip(kinds, [scores, contributions,
+                                                 bootstrap.scoreIntervals(engine, responses, formulas)]))
+        return results
+
+    result = cachedKinds(manager, kinds, [surveyID], compute)[surveyID]
+    return tuple(result[kind] for kind in kinds)
+
+#ScoreHistory of all surveys, the surveys that aren't cached are scored together in one pass
+def scoreHistory(manager, weighted=False):
+    surveys = surveysByDate(manager)
+    categories = manager.getCategories()
+    kind = WEIGHTED_SCORES if weighted else SCORES
+    results = cachedResults(manager, kind, [survey.surveyID for survey in surveys],
+                            lambda surveyIDs: engineScores(manager, surveyIDs, weighted))
+    scores = np.array([[results[survey.surveyID][category.categoryID] for category in categories]
+                       for survey in surveys], dtype=float).reshape(len(surveys), len(categories))
+    return ScoreHistory(surveys, categories, scores, RatingFormulas.fromDatabase(manager))
@@ -0,0 +1,66 @@
+import json
+
+from scoring.engine import ScoringEngine, WeightTables
+from scoring.ratings import RatingFormulas
+
+#what-if comparison of candidate weights on the answers of one survey
+#the survey's (questions x options) counts are built once and scored against all weight sets together,
+#the stored weights are always the first row
+
+
+#one candidate, answer_weights {questionID: "5,4,3,2,1"} and question_weights {questionID: weight}
+#replace the stored weights of the questions they name
+class WeightSet:
+    def __init__(self, name, answer_weights=None, question_weights=None):
+        self.name = name
+        self.answer_weights = answer_weights or {}
+        self.question_weights = question_weights or {}
+
+
+#[{"name": ..., "answer_weights": {"12": "4,4,3,2,1"}, "question_weights": {"5": 2}}, ...]
+def loadWeightSets(path):
+    with open(path, 'r') as file:
+        entries = json.load(file)
+
+    weight_sets = []
+    for number, entry in enumerate(entries):
+        weight_sets.append(WeightSet(
+            entry.get("name", f"set {number + 1}"),
+            {int(questionID): str(weights) for questionID, weights in entry.get("answer_weights", {}).items()},
+            {int(questionID): int(weight) for questionID, weight in entry.get("question_weights", {}).items()}))
+    return weight_sets
+
+
+#scores under every weight set, row i of scores (weight sets x categories), ratings and overall_scores
+#belongs to names[i]
+class Simulation:
+    def __init__(self, names, categories, scores, formulas):
+        self.names = names
+        self.categories = categories
+        self.scores = scores
+        self.ratingIDs = formulas.ratingIDs
+        self.rating_names = formulas.names
+        self.ratings = formulas.evaluate(scores)
+        self.overall_scores = formulas.overall(self.ratings)
+
+    #header and rows of the comparison table, scores rounded to 2 places
+    def table(self):
+        header = ["weights"] + [category.categoryID for category in self.categories] + self.rating_names + ["Overall"]
+        rows = []
+        for index, name in enumerate(self.names):
+            values = list(self.scores[index]) + list(self.ratings[index]) + [self.overall_scores[index]]
+            rows.append([name] + [f"{value:.2f}" for value in values])
+        return header, rows
+
+
+def simulateSurvey(manager, surveyID, weight_sets, weighted=False):
+    engine = ScoringEngine.fromDatabase(manager, weighted)
+    responses = engine.loadResponses(manager, surveyID)
+    counts = engine.optionCounts(responses)
+    answers = engine.answerCounts(responses) if weighted else None
+
+    tables = WeightTables.stack([engine.tables] + [engine.weightTables(weight_set.answer_weights, weight_set.question_weights)
+                                                   for weight_set in weight_sets])
+    scores = engine.scoresFromTotals(*engine.categoryTotals(counts, answers, tables))
+    return Simulation(["stored"] + [weight_set.name for weight_set in weight_sets], engine.categories, scores,
+                      RatingFormulas.fromDatabase(manager))
@@ -0,0 +1,56 @@
+#compare the category scores and ratings of a survey under candidate weights
+#usage: python src/simulate_weights.py <weight sets .json> <surveyID> [chart .png]
+#the JSON file is a list of {"name": ..., "answer_weights": {questionID: "5,4,3,2,1"}, "question_weights": {questionID: 2}}
+#question weights need "scoring_mode": "weighted" in config.json, run from the folder that holds config.json
+
+import sys
+
+import numpy as np
+from matplotlib.figure import Figure
+
+from database.main_database import DatabaseManager
+from scoring.simulator import loadWeightSets, simulateSurvey
+from constants import ConstantsAndUtilities
+
+USAGE = "usage: python src/simulate_weights.py <weight sets .json> <surveyID> [chart .png]"
+
+if(len(sys.argv) < 3):
+    print(USAGE)
+    sys.exit(1)
+
+manager = DatabaseManager()
+#stdout is the output, upgrade notices go to stderr
+for notice in manager.migrateDatabase():
+    print(notice, file=sys.stderr)
+#bad arguments or weight sets, e.g. question weights in the standard scoring mode or an unknown question
+try:
+    simulation = simulateSurvey(manager, int(sys.argv[2]), loadWeightSets(sys.argv[1]),
+                                ConstantsAndUtilities().isWeightedScoring())
+except ValueError as error:
+    print("error: " + str(error))
+    print(USAGE)
+    sys.exit(1)
+
+header, rows = simulation.table()
+widths = [max(len(row[column]) for row in [header] + rows) for column in range(len(header))]
+for row in [header] + rows:
+    print("  ".join(value.ljust(widths[column]) for column, value in enumerate(row)).rstrip())
+
+#grouped bars, one group per rating and one bar per weight set
+if(len(sys.argv) > 3):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot(111)
+    labels = simulation.rating_names + ['Overall']
+    values = np.column_stack([simulation.ratings, simulation.overall_scores])
+    width = 0.8 / len(simulation.names)
+    for index, name in enumerate(simulation.names):
+        ax.bar(np.arange(len(labels)) + index * width, values[index], width, label=name)
+    ax.set_xticks(np.arange(len(labels)) + width * (len(simulation.names) - 1) / 2)
+    ax.set_xticklabels(labels)
+    ax.set_ylim(0, 5)
+    ax.set_ylabel('Rating')
+    ax.grid(True, axis='y', alpha=0.3, linestyle='--')
+    ax.set_axisbelow(True)
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(sys.argv[3])
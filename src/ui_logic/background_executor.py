@@ -0,0 +1,108 @@
+from concurrent.futures import Future
+import traceback
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+
+#signal carrier for one task, emitted from the worker thread
+class _TaskSignals(QObject):
+    done = pyqtSignal(int)
+
+class _Task(QRunnable):
+    def __init__(self, request_id, future, function, args, kwargs, signals):
+        super().__init__()
+        self.request_id = request_id
+        self.future = future
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = signals
+
+    def run(self):
+        #cancelled while still queued
+        if(not self.future.set_running_or_notify_cancel()):
+            return
+        try:
+            self.future.set_result(self.function(*self.args, **self.kwargs))
+        except BaseException as error:
+            self.future.set_exception(error)
+        self.signals.done.emit(self.request_id)
+
+
+#runs data loads on a QThreadPool and hands the results back on the GUI thread
+#every request has a key, submitting a new request with the same key cancels the previous one
+#so a result that arrives for an outdated selection is dropped instead of displayed
+#create it with the displayed widget as parent, pending results are dropped when that widget is deleted
+#functions run on worker threads must not touch widgets or create matplotlib figures
+class BackgroundExecutor(QObject):
+
+    #True while at least one request is pending
+    loadingChanged = pyqtSignal(bool)
+
+    def __init__(self, parent=None, thread_pool=None):
+        super().__init__(parent)
+        if(thread_pool is None):
+            thread_pool = QThreadPool.globalInstance()
+        self.thread_pool = thread_pool
+        self._next_id = 0
+        #key -> id of the latest request
+        self._latest = {}
+        #request id -> (key, future, on_result, on_error, signals)
+        self._pending = {}
+
+    #run function(*args, **kwargs) on the thread pool and return its Future
+    #on_result(result) or on_error(exception) is called on the GUI thread unless the request went stale
+    def submit(self, key, function, *args, on_result=None, on_error=None, **kwargs):
+        self.cancel(key)
+
+        self._next_id += 1
+        request_id = self._next_id
+        future = Future()
+        signals = _TaskSignals()
+        signals.done.connect(self._onDone)
+
+        self._pending[request_id] = (key, future, on_result, on_error, signals)
+        self._latest[key] = request_id
+        self.thread_pool.start(_Task(request_id, future, function, args, kwargs, signals))
+        self._updateLoading()
+        return future
+
+    #drop the pending request for the key, it is not started if still queued
+    def cancel(self, key):
+        request_id = self._latest.pop(key, None)
+        entry = self._pending.pop(request_id, None)
+        if(entry is not None):
+            entry[1].cancel()
+            self._updateLoading()
+
+    def cancelAll(self):
+        for key in list(self._latest):
+            self.cancel(key)
+
+    def isLoading(self, key=None):
+        if(key is None):
+            return self._pending != {}
+        return key in self._latest
+
+    @pyqtSlot(int)
+    def _onDone(self, request_id):
+        entry = self._pending.pop(request_id, None)
+        #stale or cancelled request
+        if(entry is None):
+            return
+        key, future, on_result, on_error, signals = entry
+        if(self._latest.get(key) == request_id):
+            del self._latest[key]
+        self._updateLoading()
+
+        error = future.exception()
+        if(error is not None):
+            if(on_error is not None):
+                on_error(error)
+            else:
+                print("Background load failed:\n" + "".join(traceback.format_exception(error)))
+            return
+        if(on_result is not None):
+            on_result(future.result())
+
+    def _updateLoading(self):
+        self.loadingChanged.emit(self._pending != {})
@@ -1,4 +1,4 @@
-from PyQt6.QtWidgets import QVBoxLayout, QWidget, QComboBox, QStyledItemDelegate, QLabel, QScrollArea
+from PyQt6.QtWidgets import QVBoxLayout, QWidget, QComboBox, QStyledItemDelegate, QLabel, QScrollArea, QMessageBox
 from PyQt6.QtGui import QPalette, QStandardItem, QFontMetrics
 from PyQt6.QtCore import Qt, QEvent
 from PyQt6.uic import loadUi
@@ -13,6 +13,8 @@ import textwrap
 import os
 
 from database.main_database import DatabaseManager
+from ui_logic.background_executor import BackgroundExecutor
+from constants import ConstantsAndUtilities
 
 class GraphWidget(QWidget):
     def __init__(self):
@@ -23,26 +25,39 @@ class GraphWidget(QWidget):
         self.setupUi()
 
     def setupUi(self):
+        self.graph_layout = QVBoxLayout(self.graph_frame)
+        #database work runs in the background, results are dropped once the frame is closed
+        self.executor = BackgroundExecutor(self.frame)
+        self.showMessage("Loading...")
+        self.executor.submit("lists", GraphWidget.loadLists, on_result=self.populateLists, on_error=self.showLoadFailed)
+
+    #runs on a background thread, must not touch any widget
+    @staticmethod
+    def loadLists():
         manager = DatabaseManager()
-        questions = manager.getQuestions()
-        surveys = manager.getSurvey()
-        categories = manager.getCategories()
+        questions = [question.text for question in manager.getQuestions()]
+        survey_dates = [str(survey.date) for survey in manager.getSurvey()]
+        categories = [category.name for category in manager.getCategories()]
+        userIDs = [user.userID for user in manager.getUser() if user.roleID != "UNIVERSAL"]
+        return questions, survey_dates, categories, userIDs
+
+    def populateLists(self, lists):
+        questions, self.survey_dates, categories, self.userIDs = lists
 
-        self.surveyBox.addItems([str(survey.date) for survey in surveys])
+        self.surveyBox.addItems(self.survey_dates)
         self.surveyBox.currentIndexChanged.connect(lambda: self.redrawGraph())
 
         self.survey_combo_box = self.surveyBox
 
-        self.questionBox.addItems([question.text for question in questions])
+        self.questionBox.addItems(questions)
         self.questionBox.currentIndexChanged.connect(lambda: self.redrawGraph())
 
-        self.categoryBox.addItems(["All"] + [category.name for category in categories])
+        self.categoryBox.addItems(["All"] + categories)
         self.categoryBox.currentIndexChanged.connect(lambda: self.repopulateQuestions())
 
         self.viewBox.addItems(["Role", "Response", "Stakeholder Group", "Stakeholder Type"])
         self.viewBox.currentIndexChanged.connect(lambda: self.redrawGraph())
 
-        self.graph_layout = QVBoxLayout(self.graph_frame)
         self.redrawGraph()
 
     def repopulateQuestions(self):
@@ -57,11 +72,10 @@ class GraphWidget(QWidget):
         self.redrawGraph()
 
     def repopulateSurveys(self, is_multiple: bool):
-        surveys = DatabaseManager().getSurvey()
         if(is_multiple):
             self.survey_combo_box = CheckableComboBox()
             
-            self.survey_combo_box.addItems([str(survey.date) for survey in surveys])
+            self.survey_combo_box.addItems(self.survey_dates)
             self.graph_setting_frame.layout().addWidget(self.survey_combo_box, 1, 0)
             self.survey_combo_box.setCheckedItemsByIndex([i for i in range(0, 5)])
             self.survey_combo_box.setCheckedItemsChangedCallback(self.redrawGraph)
@@ -69,18 +83,16 @@ class GraphWidget(QWidget):
             self.survey_label.setText("<html><head/><body><p><span style=' font-size:12pt;'>Surveys:</span></p></body></html>")
         else:
             self.survey_combo_box = QComboBox()
-            self.survey_combo_box.addItems([str(survey.date) for survey in surveys])
+            self.survey_combo_box.addItems(self.survey_dates)
             self.survey_combo_box.currentIndexChanged.connect(lambda: self.redrawGraph())
             self.graph_setting_frame.layout().addWidget(self.survey_combo_box, 1, 0)
             #adjust the label for a single survey
             self.survey_label.setText("<html><head/><body><p><span style=' font-size:12pt;'>Survey:</span></p></body></html>")
 
     def addUserComboBox(self):
-        manager = DatabaseManager()
         #add list of users
         self.user_combo_box = QComboBox()
-        users = manager.getUser()
-        self.user_combo_box.addItems([user.userID for user in users if user.roleID != "UNIVERSAL"])
+        self.user_combo_box.addItems(self.userIDs)
         self.user_combo_box.currentIndexChanged.connect(lambda: self.redrawGraph())
 
         #add user label
@@ -108,33 +120,53 @@ class GraphWidget(QWidget):
             self.repopulateSurveys(False)
             self.removeUserComboBox()
         #remove the previous graph
-        while self.graph_layout.count():
-            widget = self.graph_layout.takeAt(0).widget()
-            if widget is not None:
-                widget.deleteLater()
-
-        self.deleteGraph()
-
-        manager = DatabaseManager()
-        current_question = manager.getQuestion(qText=self.questionBox.currentText())
+        self.clearGraphLayout()
 
         #check if no survey data available
         if(self.survey_combo_box.currentText() == ""):
+            self.executor.cancel("graph")
             return
         
         if(self.viewBox.currentText() != "Stakeholder Type"):
-            self.current_graph = MatplotlibWidget(self, current_question, manager.getSurvey(date=datetime.strptime(self.survey_combo_box.currentText(), "%Y-%m-%d").date()), 
-                                        self.viewBox.currentText())
+            survey_dates = [self.survey_combo_box.currentText()]
+            userID = None
         #for stakeholder choice
         else:
-            survey_dates = self.survey_combo_box.currentData()
-            surveys = []
-            for date in survey_dates:
-                surveys.append(manager.getSurvey(date=datetime.strptime(date, "%Y-%m-%d").date()))
-            self.current_graph = MatplotlibWidget(self, current_question, surveys[:5], self.viewBox.currentText(), self.user_combo_box.currentText())
+            survey_dates = self.survey_combo_box.currentData()[:5]
+            userID = self.user_combo_box.currentText()
 
+        #the data is loaded in the background, the figure is drawn once it arrives
+        self.showMessage("Loading...")
+        self.executor.submit("graph", MatplotlibWidget.loadGraphData, self.questionBox.currentText(), survey_dates,
+                             self.viewBox.currentText(), userID, on_result=self.drawGraph, on_error=self.showLoadFailed)
+
+    def drawGraph(self, graph_data):
+        self.clearGraphLayout()
+        self.current_graph = MatplotlibWidget(self, graph_data)
         self.graph_layout.addWidget(self.current_graph)
 
+    def showMessage(self, text):
+        self.clearGraphLayout()
+        self.graph_layout.addWidget(QLabel(ConstantsAndUtilities().formatHTML(text, True)))
+
+    def showLoadFailed(self, error):
+        self.showMessage("The data could not be loaded.")
+        failed_box = QMessageBox()
+        failed_box.setWindowTitle("Data not loaded")
+        failed_box.setText("The data could not be loaded.")
+        failed_box.setDetailedText(str(error))
+        failed_box.setIcon(QMessageBox.Icon.Warning)
+        failed_box.addButton(QMessageBox.StandardButton.Ok)
+        failed_box.exec()
+
+    def clearGraphLayout(self):
+        while self.graph_layout.count():
+            widget = self.graph_layout.takeAt(0).widget()
+            if widget is not None:
+                widget.deleteLater()
+
+        self.deleteGraph()
+
     def deleteGraph(self):
         if(self.current_graph is not None):
             plt.close(self.current_graph.current_figure)
@@ -146,21 +178,23 @@ class GraphWidget(QWidget):
         
 
 class MatplotlibWidget(QWidget):
-    def __init__(self, parent_widget, question, survey, view_type, user=None):
+    #graph_data comes from loadGraphData, the figure itself is always drawn on the GUI thread
+    def __init__(self, parent_widget, graph_data):
         super().__init__()
         self.current_figure = None
         self.parent_widget = parent_widget
         layout = QVBoxLayout()
         self.scroll_area = QScrollArea()
 
+        view_type = graph_data["view_type"]
         if view_type == "Role":
-            canvas = FigureCanvas(self.plotGraph(question, survey.surveyID))
+            canvas = FigureCanvas(self.plotGraph(graph_data))
         elif view_type == "Response":
-            canvas = FigureCanvas(self.plotHorizontalGraph(question, survey.surveyID))
+            canvas = FigureCanvas(self.plotHorizontalGraph(graph_data))
         elif view_type == "Stakeholder Group":
-            canvas = FigureCanvas(self.plotHorizontalGraphByTechnicality(question, survey.surveyID))
+            canvas = FigureCanvas(self.plotHorizontalGraphByTechnicality(graph_data))
         else:
-            canvas = FigureCanvas(self.plotHorizontalGraphByStakeholder(question, [s.surveyID for s in survey], user))
+            canvas = FigureCanvas(self.plotHorizontalGraphByStakeholder(graph_data))
 
         canvas.figure.set_facecolor('none')
         canvas.setStyleSheet("background-color: transparent;")
@@ -180,13 +214,39 @@ class MatplotlibWidget(QWidget):
             return True
         return super().eventFilter(source, event)
 
-    def plotGraph(self, question, surveyID):
-
+    #runs on a background thread and collects everything the plot for view_type needs
+    #survey_dates holds one date, or up to five for the stakeholder type view
+    @staticmethod
+    def loadGraphData(question_text, survey_dates, view_type, userID=None):
         manager = DatabaseManager()
-        answers = question.answer.answer.split(';')
+        question = manager.getQuestion(qText=question_text)
+        surveys = [manager.getSurvey(date=datetime.strptime(date, "%Y-%m-%d").date()) for date in survey_dates]
+        answers = [option.text for option in question.options]
+        graph_data = {"view_type": view_type, "question": question, "answers": answers}
+
+        if(view_type == "Stakeholder Type"):
+            graph_data["userID"] = userID
+            graph_data["surveys"] = surveys
+            #one row per survey, the user's answers in each
+            graph_data["response_array"] = MatplotlibWidget.getResponseArray(manager, question, surveys, [userID])[:, 0]
+            return graph_data
+
         users = [user for user in manager.getUser() if user.roleID != 'UNIVERSAL']
+        graph_data["users"] = users
+        graph_data["response_array"] = MatplotlibWidget.getResponseArray(manager, question, surveys[:1],
+                                                                         [user.userID for user in users])[0]
+        if(view_type == "Stakeholder Group"):
+            graph_data["technical_roles"] = [user.roleID for user in manager.getUsersByTechnicality(True)]
+            graph_data["non_technical_roles"] = [user.roleID for user in manager.getUsersByTechnicality(False)]
+        return graph_data
+
+    def plotGraph(self, graph_data):
+
+        question = graph_data["question"]
+        answers = graph_data["answers"]
+        users = graph_data["users"]
 
-        df = pd.DataFrame(self.getResponseArray(surveyID, question, answers, users), columns=answers, index=[user.userID for user in users])
+        df = pd.DataFrame(graph_data["response_array"], columns=answers, index=[user.userID for user in users])
 
         fig, ax = plt.subplots(figsize=(8, 5))  
 
@@ -210,11 +270,12 @@ class MatplotlibWidget(QWidget):
         self.current_figure = fig
         return self.current_figure
     
-    def plotHorizontalGraph(self, question, surveyID):
+    def plotHorizontalGraph(self, graph_data):
 
-        responses = question.answer.answer.split(';')
-        users = [user for user in DatabaseManager().getUser() if user.roleID != 'UNIVERSAL']
-        data = self.getResponseArray(surveyID, question, responses, users)
+        question = graph_data["question"]
+        responses = graph_data["answers"]
+        users = graph_data["users"]
+        data = graph_data["response_array"]
         num_responses = len(responses)
         
         fig, ax = plt.subplots(figsize=(8, 5))
@@ -244,19 +305,20 @@ class MatplotlibWidget(QWidget):
         self.current_figure = fig
         return self.current_figure
     
-    def plotHorizontalGraphByTechnicality(self, question, surveyID):
+    def plotHorizontalGraphByTechnicality(self, graph_data):
 
-        responses = question.answer.answer.split(';')
-        users = [user for user in DatabaseManager().getUser() if user.roleID != 'UNIVERSAL']
-        data = self.getResponseArray(surveyID, question, responses, users)
+        question = graph_data["question"]
+        responses = graph_data["answers"]
+        users = graph_data["users"]
+        data = graph_data["response_array"]
         num_responses = len(responses)
         fig, ax = plt.subplots(figsize=(8, 5))
         bar_height = 0.4
         y = np.arange(num_responses)
         
         
-        technical_roles = [user.roleID for user in DatabaseManager().getUsersByTechnicality(True)]
-        non_technical_roles = [user.roleID for user in DatabaseManager().getUsersByTechnicality(False)]
+        technical_roles = graph_data["technical_roles"]
+        non_technical_roles = graph_data["non_technical_roles"]
         
         # Combine responses for each user group
         technical_data = np.sum([data[i] for i, user in enumerate(users) if user.roleID in technical_roles], axis=0)
@@ -277,16 +339,14 @@ class MatplotlibWidget(QWidget):
         self.current_figure = fig
         return self.current_figure
     
-    def plotHorizontalGraphByStakeholder(self, question, surveyIDs, userID):
-        manager = DatabaseManager()
-        user = manager.getUser(userID)
-        responses = question.answer.answer.split(';')
-        data = []
-        for surveyID in surveyIDs:
-            survey_data = self.getResponseArray(surveyID, question, responses, [user])
-            data.append(survey_data[0])
-
-        num_surveys = len(surveyIDs)
+    def plotHorizontalGraphByStakeholder(self, graph_data):
+        question = graph_data["question"]
+        userID = graph_data["userID"]
+        surveys = graph_data["surveys"]
+        responses = graph_data["answers"]
+        data = graph_data["response_array"]
+
+        num_surveys = len(surveys)
         fig, ax = plt.subplots(figsize=(8, 5))
         bar_height = 0.4
         y = np.arange(num_surveys)
@@ -298,10 +358,6 @@ class MatplotlibWidget(QWidget):
 
         ax.set_yticks(y)
 
-        surveys = []
-        for surveyID in surveyIDs:
-            surveys.append(manager.getSurvey(surveyID))
-
         ax.set_yticklabels([str(survey.date) for survey in surveys])
         ax.legend(title='Response', bbox_to_anchor=(1.02, 1), loc='upper left')
         ax.set_xlabel("Number of Answers\n" + r"$\bf{USER}$: " + userID)
@@ -311,25 +367,11 @@ class MatplotlibWidget(QWidget):
         self.current_figure = fig
         return self.current_figure
     
-    def getResponseArray(self, surveyID, question, answers, users):
-
-        manager = DatabaseManager()
-
-        #initialise response data
-        #one row per user, one row per possible answers
-        #1 means the user chose the answer, 0 the answer was not chosen
-        response_data = []
-        for user in users:
-            responses = [response.response for response in manager.getResponse(user.roleID, surveyID, question.questionID)]
-            responses_to_add = []
-            for answer in answers:
-                if(answer in responses):
-                    responses_to_add.append(1)
-                else:
-                    responses_to_add.append(0)
-            response_data.append(responses_to_add)
-        
-        return response_data
+    #(surveys x users x options) array of the question's answers, 1 means the user chose the answer
+    #columns follow the answer options (by ordinal)
+    @staticmethod
+    def getResponseArray(manager, question, surveys, userIDs):
+        return manager.getResponseMatrix(question.questionID, [survey.surveyID for survey in surveys], userIDs)
 
 
 #checkable combo box implementation from
@@ -10,6 +10,7 @@ import os
 #local imports
 from constants import ConstantsAndUtilities
 from database.main_database import DatabaseManager
+from database.migrations import MigrationError
 from ui_logic.dashboard_processing import DashboardWindow
 from ui_logic.login import LoginWindow
 
@@ -20,6 +21,28 @@ ui_file_path = os.path.join(script_dir, '..', 'ui_design', 'new_setup.ui')
 #load ui
 NewSetupWindow, QNewSetupWindowBase = loadUiType(ui_file_path)
 
+#the database is left as it was when an upgrade fails, also shown by main on start up
+def showMigrationError(error):
+    migration_box = QMessageBox()
+    migration_box.setWindowTitle("Database upgrade failed")
+    migration_box.setText(f"The database could not be upgraded to version {error.version} ({error.description}).\n"
+                          "It was left unchanged. Please contact your administrator.")
+    migration_box.setDetailedText(str(error.error))
+    migration_box.setIcon(QMessageBox.Icon.Critical)
+    migration_box.addButton(QMessageBox.StandardButton.Ok)
+    migration_box.exec()
+
+#data an upgrade couldn't carry over, the app keeps running
+def showMigrationNotices(notices):
+    if(notices == []):
+        return
+    notice_box = QMessageBox()
+    notice_box.setWindowTitle("Database upgraded")
+    notice_box.setText("\n\n".join(notices))
+    notice_box.setIcon(QMessageBox.Icon.Information)
+    notice_box.addButton(QMessageBox.StandardButton.Ok)
+    notice_box.exec()
+
 class NewSetupWindow(QMainWindow, NewSetupWindow):
 
     def __init__(self):
@@ -69,17 +92,34 @@ class NewSetupWindow(QMainWindow, NewSetupWindow):
             #non-existant path check
             try:
                 self.manager = DatabaseManager()
+                self.manager.migrateDatabase()
             except OperationalError:
                 print("Operational error")
                 self.constants.resetPath()
                 self.generateWrongPathMessage()
                 return
+            except MigrationError as error:
+                self.constants.resetPath()
+                showMigrationError(error)
+                return
             
             self.manager.initialise_database()
             self.setupRegistrationScreen()
 
         elif (self.radioButtonExistingDatabase.isChecked()):
             self.constants.setDatabasePath(self.fileTextEdit.toPlainText())
+            #upgrade databases created by older versions in place
+            try:
+                notices = DatabaseManager().migrateDatabase()
+            except OperationalError:
+                self.constants.resetPath()
+                self.generateWrongPathMessage()
+                return
+            except MigrationError as error:
+                self.constants.resetPath()
+                showMigrationError(error)
+                return
+            showMigrationNotices(notices)
             self.loginScreen = LoginWindow()
             self.loginScreen.show()
             self.close()
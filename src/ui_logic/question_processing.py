@@ -10,6 +10,7 @@ from PyQt6.uic import loadUi
 
 from database.main_database import DatabaseManager
 from constants import ConstantsAndUtilities
+from ui_logic.background_executor import BackgroundExecutor
 
 class QuestionWidget(QWidget):
     def __init__(self, parent_widget):
@@ -18,10 +19,41 @@ class QuestionWidget(QWidget):
         self.next_button.clicked.connect(self.onNextButtonClick)
         self.back_button.clicked.connect(self.onBackButtonClick)
         self.parent_widget = parent_widget
+        #navigation is enabled once the questions are loaded
+        self.next_button.setEnabled(False)
+        self.back_button.setEnabled(False)
+        self.question_label.setText(ConstantsAndUtilities().formatHTML("Loading...", True))
+        #results are dropped if the frame is closed before they arrive
+        self.executor = BackgroundExecutor(self.question_frame)
+        self.executor.submit("questions", QuestionWidget.loadQuestions, on_result=self.setupQuestions,
+                             on_error=self.onLoadFailed)
+
+    #runs on a background thread, must not touch any widget
+    @staticmethod
+    def loadQuestions():
         manager = DatabaseManager()
         user = manager.getCurrentUser()
-        self.questions_for_role = manager.getQuestionsForRole(user.roleID)
-        self.current_survey_id = manager.getSurveyToCompleteForUser(user.userID)
+        questions_for_role = manager.getQuestionsForRole(user.roleID)
+        questions_by_category = {}
+        for question in questions_for_role:
+            questions_by_category.setdefault(question.categoryID, []).append(question)
+        return questions_for_role, questions_by_category, manager.getSurveyToCompleteForUser(user.userID)
+
+    def onLoadFailed(self, error):
+        self.question_label.setText(ConstantsAndUtilities().formatHTML("The questions could not be loaded.", True))
+        failed_box = QMessageBox()
+        failed_box.setWindowTitle("Questions not loaded")
+        failed_box.setText("The questions could not be loaded.")
+        failed_box.setDetailedText(str(error))
+        failed_box.setIcon(QMessageBox.Icon.Warning)
+        failed_box.addButton(QMessageBox.StandardButton.Ok)
+        failed_box.exec()
+
+    def setupQuestions(self, loaded):
+        #questions of the user's role, per category in questionID order
+        self.questions_for_role, self.questions_by_category, self.current_survey_id = loaded
+        self.next_button.setEnabled(True)
+        self.back_button.setEnabled(True)
         categories = []
         self.question_categories_frames = []
         #add all question categories that have corresponding questions
@@ -60,18 +92,16 @@ class QuestionWidget(QWidget):
             question.setDefaultStyleSheet()
         #highlight the new current active category
         questionCategory.highlightCategory()
-        manager = DatabaseManager()
 
         if(startFromEnd == False):
-            self.setupQuestion(manager.getQuestionsForRoleByCategory(manager.getCurrentUser().roleID, questionCategory.category.categoryID)[0])
+            self.setupQuestion(self.questions_by_category[questionCategory.category.categoryID][0])
         else:
-            self.setupQuestion(manager.getQuestionsForRoleByCategory(manager.getCurrentUser().roleID, questionCategory.category.categoryID)[-1])
+            self.setupQuestion(self.questions_by_category[questionCategory.category.categoryID][-1])
 
 
     def setupQuestion(self, question):
         
-        manager = DatabaseManager()
-        questions = manager.getQuestionsForRoleByCategory(manager.getCurrentUser().roleID, self.active_category_frame.category.categoryID)
+        questions = self.questions_by_category[self.active_category_frame.category.categoryID]
         self.current_question = question
         question_number = self.findQuestionIndex(question, questions)
         self.question_number_label.setText(ConstantsAndUtilities().formatHTML(f"Question {question_number + 1} out of {len(questions)}", True))
@@ -111,8 +141,7 @@ class QuestionWidget(QWidget):
         #save the current question
         self.saveAnswer()
         #handle displaying the next question
-        manager = DatabaseManager()
-        next_question = self.getNextQuestion(manager.getQuestionsForRoleByCategory(manager.getCurrentUser().roleID, self.active_category_frame.category.categoryID))
+        next_question = self.getNextQuestion(self.questions_by_category[self.active_category_frame.category.categoryID])
         if(next_question is None):
             current_category_index = self.findCategoryIndex()
             #handle the user reaching the last question
@@ -144,8 +173,7 @@ class QuestionWidget(QWidget):
         #save the current question
         self.saveAnswer()
 
-        manager = DatabaseManager()
-        previous_question = self.getPreviousQuestion(manager.getQuestionsForRoleByCategory(manager.getCurrentUser().roleID, self.active_category_frame.category.categoryID))
+        previous_question = self.getPreviousQuestion(self.questions_by_category[self.active_category_frame.category.categoryID])
 
         if(previous_question is None):
             current_category_index = self.findCategoryIndex()
@@ -179,12 +207,16 @@ class QuestionWidget(QWidget):
         except IndexError:
             return
 
-        for questionID, all_answers in answers.items():
-            for single_answer in all_answers:
-                manager.addResponse(questionID, current_user, single_answer, current_survey)
+        #all responses and the finished flag are stored together or not at all
+        if(not manager.submitSurvey(current_user, current_survey, answers)):
+            failed_box = QMessageBox()
+            failed_box.setWindowTitle("Submission failed")
+            failed_box.setText("Your answers could not be submitted.\nThey have been kept, please try again.")
+            failed_box.addButton(QMessageBox.StandardButton.Ok)
+            failed_box.exec()
+            return
 
         Answers().deleteAnswers()
-        manager.setUserFinishedSurvey(current_survey, current_user)
         self.parent_widget.onStartSurveyClick(None)
         
         
@@ -236,7 +268,7 @@ class AnswersFrame(QFrame):
         super().__init__()
         self.layout = QVBoxLayout(self)
         self.answer = answer
-        self.possible_answers = answer.answer.split(';')
+        self.possible_answers = [option.text for option in question_widget.current_question.options]
         self.parent_widget = question_widget
         self.answer_frames = []
         self.button_group = QButtonGroup()
@@ -359,9 +391,11 @@ class Answers:
             os.remove(self.path_to_file)
 
     def getNumberOfAnsweredQuestions(self):
+        #a checklist that was shown and left empty means none of the options apply
+        catalog = DatabaseManager().getCatalog()
         count = 0
         for key, value in self.answers.items():
-            if(value != []):
+            if(value != [] or catalog.isChecklist(key)):
                 count += 1
         return count
     
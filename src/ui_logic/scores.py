@@ -1,84 +1,187 @@
 import os
 from PyQt6.uic import loadUi
-from PyQt6.QtWidgets import QWidget, QVBoxLayout
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QHeaderView, QMessageBox
 from PyQt6.QtCore import Qt
 from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
 from database.main_database import DatabaseManager
+from scoring.engine import ScoreHistory
+from scoring.ratings import RatingFormulas
+from scoring import score_cache
+from ui_logic.background_executor import BackgroundExecutor
+from constants import ConstantsAndUtilities
 
 class ScoresWidget(QWidget):
     def __init__(self):
         super().__init__()
-        self.manager = DatabaseManager()
         self.loadUI()
-        self.setupComboBoxes()
         self.current_graph = None
+        #(surveyID, results) of the last calculation, switching between its views doesn't recalculate
+        self.survey_results = None
         self.scroll_widget.setLayout(QVBoxLayout())
-        #start calculation on start
-        self.chooseDisplayType()
+        #database work runs in the background, results are dropped once the frame is closed
+        self.executor = BackgroundExecutor(self.scores_frame)
+        self.showLoading()
+        #start calculation once the survey list is loaded
+        self.executor.submit("surveys", lambda: DatabaseManager().getSurvey(),
+                             on_result=self.setupComboBoxes, on_error=self.showLoadFailed)
 
     def loadUI(self):
         script_dir = os.path.dirname(os.path.abspath(__file__))
         ui_path = os.path.join(script_dir, '..', 'ui_design', 'scores.ui')
         loadUi(ui_path, self)
 
-    def setupComboBoxes(self):
-        surveys = self.manager.getSurvey()
+    def setupComboBoxes(self, surveys):
         self.surveyBox.addItems(str(survey.date) for survey in surveys)
         self.surveyBox.currentTextChanged.connect(lambda: self.chooseDisplayType())
 
-        self.typeBox.addItems(["List", "Chart"])
+        self.typeBox.addItems(["List", "Chart", "Breakdown", "Trend"])
         self.typeBox.currentTextChanged.connect(lambda: self.chooseDisplayType())
-        
+        self.chooseDisplayType()
 
+    #a new selection replaces the calculation still running for the previous one
     def chooseDisplayType(self):
+        #the trend covers all surveys, the survey selection doesn't apply to it
+        if(self.typeBox.currentText() == "Trend"):
+            self.showLoading()
+            self.executor.submit("scores", ScoresWidget.calculateHistory,
+                                 on_result=self.displayTrend, on_error=self.showLoadFailed)
+            return
+
+        if(self.surveyBox.count() == 0):
+            self.executor.cancel("scores")
+            self.showMessage("There are no surveys yet.")
+            return
 
-        current_type = self.typeBox.currentIndex()
-        scores, ratings, overall_score = self.calculateScores()
-        if(current_type == 0):
-            self.displayList(scores, ratings, overall_score)
+        surveyID = self.surveyBox.currentIndex() + 1
+        if(self.survey_results is not None and self.survey_results[0] == surveyID):
+            self.executor.cancel("scores")
+            self.displayScores(self.survey_results[1])
+            return
+        self.showLoading()
+        self.executor.submit("scores", ScoresWidget.calculateScores, surveyID,
+                             on_result=lambda results: self.onScoresCalculated(surveyID, results),
+                             on_error=self.showLoadFailed)
+
+    def onScoresCalculated(self, surveyID, results):
+        if(results is None):
+            self.showMessage("The survey could not be found.")
+            return
+        self.survey_results = (surveyID, results)
+        self.displayScores(results)
+
+    #results is the ScoreHistory of the selected survey, its per question contributions
+    #and the confidence intervals of its scores
+    def displayScores(self, results):
+        history, contributions, intervals = results
+        current_type = self.typeBox.currentText()
+        if(current_type == "List"):
+            self.displayList(history, intervals)
+        elif(current_type == "Breakdown"):
+            self.displayBreakdown(history, contributions)
         else:
-            self.displayGraph(ratings, overall_score)
+            self.displayGraph(history, intervals)
 
-    def displayList(self, scores, ratings, overall_score):
+    def displayList(self, results, intervals):
 
         #clear the display widget and the graph before switching views
         self.clear_graph()
 
         #this widget is for the textual list, loaded from a UI file
         display_widget = ScoreListWidget()
-        score_strings = [str(score) + '/5' for score in scores]
-        rating_strings = ["""<span style=" font-size:12pt; color:#007AFF">""" + f"{rating:.2f}/5" + "</span>"
-                           for rating in ratings]
+        scores, ratings, overall_score = results.scores[0], results.ratings[0], results.overall_scores[0]
+        #the 95% confidence range follows every score
+        score_strings = [str(float(score)) + '/5' + self.formatRange(intervals["categories"][category.categoryID])
+                         for category, score in zip(results.categories, scores)]
+        rating_strings = ["""<span style=" font-size:12pt; color:#007AFF">""" + f"{rating:.2f}/5" + "</span>" +
+                          self.formatRange(intervals["ratings"][ratingID])
+                          for ratingID, rating in zip(results.ratingIDs, ratings)]
         overall_score_string = ("""<span style=" font-size:16pt; color:#00B5B8">""" + f"{overall_score:.2f}/5" +
-                                "</span>")
+                                "</span>" + self.formatRange(intervals["overall"]))
         
-        #set up score labels
-        display_widget.tdu_score.setText(score_strings[0])
-        display_widget.iab_score.setText(score_strings[1])
-        display_widget.spi_score.setText(score_strings[2])
-        display_widget.sta_score.setText(score_strings[3])
-        display_widget.dsa_score.setText(score_strings[4])
+        #set up score labels, the labels are named after the category and rating IDs
+        for category, score_string in zip(results.categories, score_strings):
+            label = getattr(display_widget, category.categoryID.lower() + '_score', None)
+            if(label is not None):
+                label.setText(score_string)
 
         #set up total ratings
-        display_widget.need_score.setText(rating_strings[0])
-        display_widget.attitude_score.setText(rating_strings[1])
-        display_widget.awareness_score.setText(rating_strings[2])
+        for ratingID, rating_string in zip(results.ratingIDs, rating_strings):
+            label = getattr(display_widget, ratingID.lower() + '_score', None)
+            if(label is not None):
+                label.setText(rating_string)
         display_widget.overall_score.setText(overall_score_string)
 
         #add the textual list to the display frame
         self.scroll_widget.layout().addWidget(display_widget, alignment=Qt.AlignmentFlag.AlignCenter)
 
-    def displayGraph(self, ratings, overall_score):
+    def formatRange(self, bounds):
+        return f" ({bounds[0]:.2f} - {bounds[1]:.2f})"
+
+    def displayGraph(self, results, intervals):
         self.clear_graph()
         # Create and add the graph
-        self.current_graph = GraphWidget.create_ratings_graph(ratings, overall_score)
+        bounds = [intervals["ratings"][ratingID] for ratingID in results.ratingIDs] + [intervals["overall"]]
+        self.current_graph = GraphWidget.create_ratings_graph(results.ratings[0], results.overall_scores[0],
+                                                              results.rating_names, bounds)
         self.scroll_widget.layout().addWidget(self.current_graph)
 
+    #per question contributions to each category score, grouped by category in category order
+    def displayBreakdown(self, results, contributions):
+        self.clear_graph()
+
+        category_order = {category.categoryID: index for index, category in enumerate(results.categories)}
+        category_scores = {category.categoryID: results.scores[0][index] for index, category in enumerate(results.categories)}
+        contributions = sorted(contributions, key=lambda row: (category_order.get(row["categoryID"], 0), -row["share"]))
+
+        table = QTableWidget(len(contributions), 5)
+        table.setHorizontalHeaderLabels(["Category", "Question", "Mean score", "Scored answers", "Share of category"])
+        for row, contribution in enumerate(contributions):
+            values = [f"{contribution['categoryID']} ({category_scores[contribution['categoryID']]:.2f}/5)",
+                      contribution["text"], f"{contribution['mean']:.2f}", f"{contribution['count']:g}",
+                      f"{contribution['share']:.0%}"]
+            for column, value in enumerate(values):
+                table.setItem(row, column, QTableWidgetItem(value))
+        table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        table.setWordWrap(True)
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        table.resizeRowsToContents()
+
+        self.scroll_widget.layout().addWidget(table)
+
+    def displayTrend(self, history):
+        if(len(history.surveys) == 0):
+            self.showMessage("There are no surveys yet.")
+            return
+        self.clear_graph()
+        self.current_graph = GraphWidget.create_trend_graph(history)
+        self.scroll_widget.layout().addWidget(self.current_graph)
+
+    def showLoading(self):
+        self.showMessage("Calculating...")
+
+    def showLoadFailed(self, error):
+        self.showMessage("The scores could not be loaded.")
+        failed_box = QMessageBox()
+        failed_box.setWindowTitle("Scores not loaded")
+        failed_box.setText("The scores could not be loaded.")
+        failed_box.setDetailedText(str(error))
+        failed_box.setIcon(QMessageBox.Icon.Warning)
+        failed_box.addButton(QMessageBox.StandardButton.Ok)
+        failed_box.exec()
+
+    def showMessage(self, text):
+        self.clear_graph()
+        label = QLabel(ConstantsAndUtilities().formatHTML(text, True))
+        self.scroll_widget.layout().addWidget(label, alignment=Qt.AlignmentFlag.AlignCenter)
+
     def clear_graph(self):
         """
         Cleans up and removes the current graph if it exists.
@@ -96,17 +199,28 @@ class ScoresWidget(QWidget):
             plt.close(self.current_graph.figure)  # Close the matplotlib figure
             self.current_graph = None
 
-    def calculateScores(self):
+    #runs on a background thread, must not touch any widget
+    #None if there is no such survey, nothing is cached for it
+    @staticmethod
+    def calculateScores(surveyID):
         
-        current_surveyid = self.surveyBox.currentIndex() + 1
-        responses = self.manager.getResponsesBySurvey(current_surveyid)
-        categories = self.manager.getCategories()
-        scores = [ThreadedScoreCalculator().calculateScorePerCategory(responses, category.categoryID) for category in categories]
-        ratings = [(scores[0]+scores[1])/2,
-                           (scores[2]+scores[3])/2, scores[4]]
-        overall_score = sum(ratings)/len(ratings)
+        manager = DatabaseManager()
+        survey = manager.getSurvey(surveyID=surveyID)
+        if(survey is None):
+            return None
+        #scores, their breakdown and intervals are cached per survey until its answers or the weights change
+        category_scores, contributions, intervals = score_cache.surveyResults(manager, surveyID,
+                                                                              ConstantsAndUtilities().isWeightedScoring())
+        categories = manager.getCategories()
+        scores = np.array([[category_scores[category.categoryID] for category in categories]])
+
+        return (ScoreHistory([survey], categories, scores,
+                             RatingFormulas.fromDatabase(manager)), contributions, intervals)
 
-        return scores, ratings, overall_score
+    #scores of every survey in one pass over the answers, runs on a background thread
+    @staticmethod
+    def calculateHistory():
+        return score_cache.scoreHistory(DatabaseManager(), ConstantsAndUtilities().isWeightedScoring())
 
 # Small class for loading the list widget
 class ScoreListWidget(QWidget):
@@ -117,39 +231,29 @@ class ScoreListWidget(QWidget):
         loadUi(ui_path, self)
         
 # Class for multithreaded asynchronous score calculation
+# Kept as the reference implementation of the scoring rules, the scores shown come from
+# scoring.engine which must match it in the standard scoring mode
 class ThreadedScoreCalculator:
     def __init__(self, max_workers=4):
         self.max_workers = max_workers
         self.manager = DatabaseManager()
-        self.questions = self.manager.getQuestions()
-        self.answers = self.manager.getAnswers()
+        self.catalog = self.manager.getCatalog()
 
     def getResponsesPerCategory(self, responses, categoryID):
         
         questions = set(q.questionID for q in self.manager.getQuestionsByCategory(categoryID))
         return [r for r in responses if r.questionID in questions]
     
-    def getResponseWeight(self, response):
-
-        #retrieve the answer list
-        response_text = response.response
-        question_response = next((x for x in self.questions if response.questionID == x.questionID), None)
-        #return if each response is + or -1
-        if(len(question_response.answer_weights) == 2):
-            return question_response.answer_weights
-        
-        answer_response = next((x for x in self.answers if question_response.answerID == x.answerID), None)
-        answer_text = answer_response.answer
-        answers = answer_text.split(';')
-        weights = question_response.answer_weights.split(',')
-        return weights[answers.index(response_text)]
+    def getResponseOption(self, response):
+        return self.catalog.getAnswerOption(response.questionID, text=response.response)
         
     def calculateResponseScore(self, response) -> tuple[int, int]:
         """Calculate score for a single response"""
-        weight = self.getResponseWeight(response)
-        if weight in ["+1", "0", "-1"]:
+        option = self.getResponseOption(response)
+        #checklist options and options weighted 0 don't count
+        if not option.scored:
             return 0, 0
-        return int(weight), 1
+        return option.weight, 1
         
     def calculateScorePerCategory(self, responses, categoryID: int) -> float:
         """Multithreaded version of score calculation"""
@@ -176,7 +280,8 @@ class ThreadedScoreCalculator:
 
 class GraphWidget:
 
-    def create_ratings_graph(ratings, overall_score):
+    #bounds holds the (low, high) confidence interval of every rating and the overall score, drawn as error bars
+    def create_ratings_graph(ratings, overall_score, rating_names=('Need', 'Attitude', 'Awareness'), bounds=None):
     
         # Create figure and axis
         fig = Figure(figsize=(8, 6), facecolor='none')
@@ -184,15 +289,19 @@ class GraphWidget:
         ax.set_facecolor('none')
         
         # Data for plotting
-        categories = ['Need', 'Attitude', 'Awareness', 'Overall']
+        categories = list(rating_names) + ['Overall']
         all_values = list(ratings) + [overall_score]
-        colors = [(0/255, 122/255, 255/255, 0.4),  # Blue with transparency
-                 (0/255, 122/255, 255/255, 0.4),  # Blue with transparency
-                 (0/255, 122/255, 255/255, 0.4),  # Blue with transparency
-                 (0/255, 122/255, 255/255, 1.0)]  # Solid blue for the last bar
+        colors = ([(0/255, 122/255, 255/255, 0.4)] * len(ratings) +  # Blue with transparency
+                  [(0/255, 122/255, 255/255, 1.0)])  # Solid blue for the last bar
         
         # Create bars
-        bars = ax.bar(categories, all_values, color=colors)
+        if bounds is None:
+            bars = ax.bar(categories, all_values, color=colors)
+        else:
+            errors = [[max(value - low, 0) for value, (low, high) in zip(all_values, bounds)],
+                      [max(high - value, 0) for value, (low, high) in zip(all_values, bounds)]]
+            bars = ax.bar(categories, all_values, color=colors, yerr=errors, capsize=6,
+                          error_kw={'ecolor': (0.3, 0.3, 0.3), 'elinewidth': 1})
         
         # Customize the graph
         ax.set_ylim(0, 5)  # Set y-axis range from 0 to 5
@@ -202,10 +311,11 @@ class GraphWidget:
         ax.grid(True, axis='y', alpha=0.3, linestyle='--')
         ax.set_axisbelow(True)
         
-        # Add value labels on top of each bar
-        for bar in bars:
+        # Add value labels on top of each bar, above the error bar if there is one
+        for index, bar in enumerate(bars):
             height = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width()/2., height,
+            top = height if bounds is None else max(height, bounds[index][1])
+            ax.text(bar.get_x() + bar.get_width()/2., top,
                     f'{height:.2f}',
                     ha='center', va='bottom')
         
@@ -216,4 +326,35 @@ class GraphWidget:
         # Adjust layout to prevent label cutoff
         fig.tight_layout()
         
-        return canvas
\ No newline at end of file
+        return canvas
+
+    #category scores and ratings of all surveys over the survey dates
+    def create_trend_graph(history):
+
+        fig = Figure(figsize=(8, 6), facecolor='none')
+        ax = fig.add_subplot(111)
+        ax.set_facecolor('none')
+
+        #surveys are evenly spaced and labelled with their date
+        positions = list(range(len(history.surveys)))
+
+        for index, category in enumerate(history.categories):
+            ax.plot(positions, history.scores[:, index], marker='o', linewidth=1, alpha=0.4,
+                    label=category.categoryID)
+        for index, rating in enumerate(history.rating_names):
+            ax.plot(positions, history.ratings[:, index], marker='s', linewidth=2, label=rating)
+        ax.plot(positions, history.overall_scores, marker='D', linewidth=3,
+                color=(0/255, 122/255, 255/255, 1.0), label='Overall')
+
+        ax.set_xticks(positions)
+        ax.set_xticklabels([str(date) for date in history.dates], rotation=45, ha='right')
+        ax.set_ylim(0, 5)
+        ax.set_ylabel('Score')
+        ax.grid(True, axis='y', alpha=0.3, linestyle='--')
+        ax.set_axisbelow(True)
+        ax.legend(loc='center left', bbox_to_anchor=(1, 0.5), fontsize='small')
+
+        canvas = FigureCanvas(fig)
+        canvas.setStyleSheet("background-color:white;")
+        fig.tight_layout()
+        return canvas
@@ -33,11 +33,17 @@ class InviteUsersToSurveyWidget(QWidget):
                 frame.check_box.setChecked(False)
     
     def onStartSurveyClicked(self):
-        manager = DatabaseManager()
-        survey_id = manager.createSurvey()
-        for frame in self.user_frames:
-            if(frame.check_box.isChecked()):
-                manager.inviteUserToSurvey(frame.username, manager.getSurvey(survey_id).surveyID)
+        selected_users = [frame.username for frame in self.user_frames if frame.check_box.isChecked()]
+        #the survey and all invitations are created in a single transaction
+        surveyID = DatabaseManager().createSurveyWithInvitations(userIDs=selected_users)
+        if(surveyID is None):
+            failed_box = QMessageBox()
+            failed_box.setWindowTitle("Survey not created")
+            failed_box.setText("The survey could not be created.\nPlease try again.")
+            failed_box.setIcon(QMessageBox.Icon.Warning)
+            failed_box.addButton(QMessageBox.StandardButton.Ok)
+            failed_box.exec()
+            return
 
         submitted_box = QMessageBox()
         submitted_box.setWindowTitle("Survey created")
@@ -0,0 +1,25 @@
+import json
+import os
+import sys
+
+import pytest
+
+#the application imports its packages from src (see main.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from database.engine_registry import EngineRegistry
+from database.main_database import DatabaseManager
+
+
+#a new database with the default questions in a temporary folder, config.json is read from the working directory
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open(tmp_path / 'config.json', 'w') as file:
+        json.dump({'database_path': str(tmp_path).replace('\\', '/')}, file)
+
+    manager = DatabaseManager()
+    manager.migrateDatabase()
+    manager.initialise_database()
+    yield manager
+    EngineRegistry.dispose()
@@ -0,0 +1,41 @@
+import json
+import sqlite3
+
+from database.main_database import DatabaseManager
+from scoring import score_cache
+
+
+#edit the database the way another computer sharing the file would, outside of this process
+def editExternally(manager, statement):
+    connection = sqlite3.connect(manager.constants.getDatabasePath() + "/" + manager.constants.database_name)
+    try:
+        connection.execute(statement)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def test_external_edits_recompute_cached_scores(manager, tmp_path):
+    #the read cache keeps the answers in memory as well as the catalog keeping the weights
+    with open(tmp_path / 'config.json', 'w') as file:
+        json.dump({'database_path': str(tmp_path).replace('\\', '/'), 'query_cache': {'max_age': 3600}}, file)
+    manager = DatabaseManager()
+
+    manager.addUser('test.ceo', 'CEO', 'Password123!#')
+    surveyID = manager.createSurveyWithInvitations()
+    answers = {question.questionID: [question.options[0].text] for question in manager.getQuestionsForRole('CEO')
+               if question.answer.type == 'single'}
+    assert manager.submitSurvey('test.ceo', surveyID, answers)
+    answered = {question.categoryID for question in manager.getQuestionsForRole('CEO')
+                if question.questionID in answers and question.options[0].scored}
+
+    scores = score_cache.surveyResults(manager, surveyID)[0]
+    assert any(scores[categoryID] != 1.0 for categoryID in answered)
+
+    editExternally(manager, "UPDATE answer_options SET weight = 1 WHERE scored")
+    scores = score_cache.surveyResults(manager, surveyID)[0]
+    assert {scores[categoryID] for categoryID in answered} == {1.0}
+
+    editExternally(manager, "DELETE FROM survey_answers")
+    scores = score_cache.surveyResults(manager, surveyID)[0]
+    assert set(scores.values()) == {0.0}
@@ -0,0 +1,101 @@
+import random
+
+import pytest
+
+from scoring.engine import ScoringEngine
+
+#default questions used below
+PLUS_CHECKLIST = 1     #TDU, "+1"
+MINUS_CHECKLIST = 22   #SPI, "-1"
+
+
+def addSurvey(manager):
+    manager.addUser('test.ceo', 'CEO', 'Password123!#')
+    return manager.createSurveyWithInvitations()
+
+
+def test_empty_checklist_is_stored(manager):
+    surveyID = addSurvey(manager)
+    single = next(question for question in manager.getQuestions() if question.answer.type == 'single')
+
+    assert manager.submitSurvey('test.ceo', surveyID, {PLUS_CHECKLIST: [], single.questionID: []})
+
+    #the checklist is answered with nothing ticked, the unanswered single choice question is not stored
+    assert [(row.questionID, row.choices) for row in manager.getSurveyAnswers(surveyID)] == [(PLUS_CHECKLIST, 0)]
+
+
+def test_weighted_empty_checklists(manager):
+    surveyID = addSurvey(manager)
+    assert manager.submitSurvey('test.ceo', surveyID, {PLUS_CHECKLIST: [], MINUS_CHECKLIST: []})
+
+    engine = ScoringEngine.fromDatabase(manager, weighted=True)
+    scores = engine.categoryScores(engine.loadResponses(manager, surveyID))
+
+    #nothing ticked is the lowest score of a "+1" checklist and the highest of a "-1" checklist
+    assert scores['TDU'] == 1.0
+    assert scores['SPI'] == 5.0
+
+
+def test_standard_scoring_ignores_empty_checklists(manager):
+    surveyID = addSurvey(manager)
+    assert manager.submitSurvey('test.ceo', surveyID, {PLUS_CHECKLIST: [], MINUS_CHECKLIST: []})
+
+    engine = ScoringEngine.fromDatabase(manager)
+    scores = engine.categoryScores(engine.loadResponses(manager, surveyID))
+
+    assert set(scores.values()) == {0.0}
+
+
+def test_candidate_weights_need_one_weight_per_option(manager):
+    engine = ScoringEngine.fromDatabase(manager)
+    question = next(question for question in manager.getQuestions() if len(question.options) == 5
+                    and question.answer_weights not in ('+1', '-1'))
+
+    with pytest.raises(ValueError):
+        engine.weightTables({question.questionID: "1,1"})
+    engine.weightTables({question.questionID: "1,1,1,1,1", PLUS_CHECKLIST: "-1"})
+
+
+#one survey answered at random by a user of every role
+def addAnsweredSurvey(manager):
+    random.seed(1)
+    for index, roleID in enumerate(['CEO', 'CFO', 'CPO', 'CISO', 'CIO', 'CTO']):
+        manager.addUser(f'test.{roleID.lower()}', roleID, 'Password123!#', index >= 2)
+    surveyID = manager.createSurveyWithInvitations()
+    for user in manager.getUser():
+        answers = {}
+        for question in manager.getQuestionsForRole(user.roleID):
+            options = [option.text for option in question.options]
+            if(question.answer.type == 'single'):
+                answers[question.questionID] = [random.choice(options)]
+            else:
+                answers[question.questionID] = random.sample(options, random.randint(0, len(options) - 1))
+        assert manager.submitSurvey(user.userID, surveyID, answers)
+    return surveyID
+
+
+def test_standard_scoring_matches_reference(manager):
+    ui_scores = pytest.importorskip('ui_logic.scores')
+    surveyID = addAnsweredSurvey(manager)
+
+    engine = ScoringEngine.fromDatabase(manager)
+    scores = engine.categoryScores(engine.loadResponses(manager, surveyID))
+
+    reference = ui_scores.ThreadedScoreCalculator()
+    responses = manager.getResponsesBySurvey(surveyID)
+    for category in manager.getCategories():
+        assert scores[category.categoryID] == reference.calculateScorePerCategory(responses, category.categoryID)
+
+
+def test_sql_category_scores_match_reference(manager):
+    ui_scores = pytest.importorskip('ui_logic.scores')
+    surveyID = addAnsweredSurvey(manager)
+
+    reference = ui_scores.ThreadedScoreCalculator()
+    responses = manager.getResponsesBySurvey(surveyID)
+    roles = {user.userID: user.roleID for user in manager.getUser()}
+    for roleID in [None, 'CEO', 'CTO']:
+        scores = manager.calculateCategoryScores(surveyID, roleID)
+        role_responses = [response for response in responses if roleID is None or roles[response.userID] == roleID]
+        for category in manager.getCategories():
+            assert scores[category.categoryID] == reference.calculateScorePerCategory(role_responses, category.categoryID)